@@ -7,3 +7,5 @@ admin.site.register(Listing)
 admin.site.register(Category)
 admin.site.register(Comment)
 admin.site.register(Bid)
+admin.site.register(Notification)
+admin.site.register(NotificationEvent)
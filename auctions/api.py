@@ -0,0 +1,376 @@
+"""
+Version 1 of the JSON API, served under /api/v1/.
+
+- GET  listings                   active listings, ?category= and ?after= cursor
+- GET  listings/<id>              one listing
+- GET  listings/<id>/bids         the highest bids on a listing
+- POST listings/<id>/bids         places a bid, {"amount": ...}
+- GET  listings/<id>/comments     comments newest first, ?after= cursor
+- POST listings/<id>/comments     adds a comment, {"message": ...}
+- GET  watchlist                  the listings the user watches, ?after= cursor
+- POST watchlist                  watches and unwatches many listings at once,
+                                  {"add": [ids], "remove": [ids]}
+- PUT/DELETE watchlist/<id>       watches or stops watching a listing
+
+Listing responses take ?fields=id,title,price to return only some fields;
+only the columns and joins those fields need are queried. Every listing
+has a version that is incremented with each bid, watcher, new thumbnail
+and save (pre_save receiver below) and when it closes, and listing responses carry a strong ETag
+derived from it. A client polling a listing with If-None-Match gets a 304
+after a primary key lookup of the version alone.
+
+Clients authenticate with the site's session cookie, so unsafe requests
+need the CSRF token like the HTML forms do.
+"""
+import json
+import zlib
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import condition, require_GET, require_http_methods
+
+from . import notifications
+from .bidding import bid_history, parse_amount, place_bid
+from .models import Comment, Listing, NotificationEvent
+from .pagination import keyset_page, timeline_page
+from .routers import replica_reads
+from .signals import comment_added
+from .watchlist import WATCHLIST_BATCH_SIZE, unwatch, watch as watch_listings, watched_ids
+
+# API field name -> the lookup it is read from
+LISTING_FIELDS = {
+    "id": "pk",
+    "title": "title",
+    "description": "description",
+    "price": "current_price",
+    "bids": "bid_count",
+    "active": "isActive",
+    "ends_at": "ends_at",
+    "category": "category__categoryName",
+    "owner": "owner__username",
+    "high_bidder": "high_bidder__username",
+    "image": "image",
+    "thumbnail": "thumbnail",
+    "version": "version",
+    "watchers": "watcher_count",
+}
+
+# Fields returned by the listing collections when ?fields= is not given;
+# a single listing returns every field
+SUMMARY_FIELDS = ("id", "title", "price", "bids", "active", "ends_at", "category", "thumbnail")
+
+# Fields holding the name of a stored file, returned as its URL
+FILE_FIELDS = ("image", "thumbnail")
+
+
+class FieldError(ValueError):
+    pass
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def login_required(view):
+    """
+    Answers requests by anonymous users with 401 instead of a login redirect.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error("Authentication required", 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def requested_fields(request, default):
+    """
+    Returns the listing fields named in ?fields=, or `default`.
+    Raises FieldError for unknown field names.
+    """
+    value = request.GET.get("fields")
+    if not value:
+        return tuple(default)
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in fields if name not in LISTING_FIELDS]
+    if unknown or not fields:
+        raise FieldError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(LISTING_FIELDS)}")
+    return fields
+
+
+def listing_values(queryset, fields):
+    """
+    Selects only the columns, and joins, needed for `fields`. The primary
+    key and version are always selected, for cursors and ETags.
+    """
+    lookups = {LISTING_FIELDS[name] for name in fields} | {"pk", "version"}
+    return queryset.values(*lookups)
+
+
+def serialize_listing(row, fields):
+    data = {}
+    for name in fields:
+        value = row[LISTING_FIELDS[name]]
+        if name in FILE_FIELDS:
+            value = default_storage.url(value) if value else None
+        data[name] = value
+    return data
+
+
+def payload(request):
+    """
+    Returns the request body, sent either as JSON or as form fields.
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+
+def etag(*parts):
+    """
+    Returns a strong ETag, quoted, made of the given parts.
+    """
+    return '"' + ".".join(str(part) for part in parts) + '"'
+
+
+def checksum(text):
+    return format(zlib.crc32(text.encode()), "x")
+
+
+def fields_tag(fields):
+    # A sparse response is a different representation of the listing, so it
+    # needs an ETag of its own
+    return checksum(",".join(fields))
+
+
+def collection_response(request, page, fields, nextUrl):
+    """
+    Returns a page of listings with an ETag derived from the version of
+    every listing on it and the cursor of the next page, or a 304 if the
+    client already has that page.
+    """
+    # A listing created after a full last page adds a next page without
+    # changing the rows of this one
+    rows = ",".join(f"{row['pk']}:{row['version']}" for row in page)
+    tag = etag(fields_tag(fields), checksum(f"{rows};{page.next_cursor or ''}"))
+    response = get_conditional_response(request, etag=tag)
+    if response is None:
+        response = JsonResponse({
+            "results": [serialize_listing(row, fields) for row in page],
+            "next": nextUrl(page.next_cursor) if page.next_cursor is not None else None,
+        })
+    response["ETag"] = tag
+    return response
+
+
+def next_url(request):
+    """
+    Returns a function building the URL of the page after a cursor, keeping
+    the other query parameters of the request.
+    """
+    def build(cursor):
+        params = request.GET.copy()
+        params["after"] = cursor
+        return f"{request.path}?{params.urlencode()}"
+    return build
+
+
+@require_GET
+@replica_reads
+def listings(request):
+    """
+    Returns a page of active listings, optionally of one category.
+    """
+    try:
+        fields = requested_fields(request, SUMMARY_FIELDS)
+    except FieldError as e:
+        return error(str(e), 400)
+    queryset = Listing.objects.filter(isActive=True)
+    if request.GET.get("category"):
+        queryset = queryset.filter(category__categoryName=request.GET["category"])
+    page = keyset_page(listing_values(queryset, fields), request.GET.get("after"))
+    return collection_response(request, page, fields, next_url(request))
+
+
+def listing_etag(request, id):
+    # Only the version column is read, so answering If-None-Match with a
+    # 304 costs a single primary key lookup
+    try:
+        fields = requested_fields(request, LISTING_FIELDS)
+    except FieldError:
+        return None
+    version = Listing.objects.filter(pk=id).values_list("version", flat=True).first()
+    if version is None:
+        return None
+    return etag(id, version, fields_tag(fields))
+
+
+@require_GET
+@replica_reads
+@condition(etag_func=listing_etag)
+def listing(request, id):
+    """
+    Returns a single listing.
+    """
+    try:
+        fields = requested_fields(request, LISTING_FIELDS)
+    except FieldError as e:
+        return error(str(e), 400)
+    row = listing_values(Listing.objects.filter(pk=id), fields).first()
+    if row is None:
+        return error("Listing not found", 404)
+    return JsonResponse(serialize_listing(row, fields))
+
+
+@require_http_methods(["GET", "POST"])
+def bids(request, id):
+    """
+    GET returns the highest bids on a listing; POST places a bid.
+    """
+    if request.method == "GET":
+        get_object_or_404(Listing.objects.only("pk"), pk=id)
+        return JsonResponse({"results": [
+            {"amount": row["bid"], "bidder": row["username"], "created_at": row["created_at"]}
+            for row in bid_history(id)
+        ]})
+    return place(request, id)
+
+
+@login_required
+def place(request, id):
+    amount = parse_amount(payload(request).get("amount"))
+    if amount is None:
+        return error("The amount must be a positive number", 400)
+    listing = get_object_or_404(Listing.objects.only("pk", "isActive", "ends_at"), pk=id)
+    if not listing.is_open:
+        return error("The auction is closed", 409)
+    bid = place_bid(id, request.user, amount)
+    if bid is None:
+        return error("The bid must be higher than the current price of an open listing you do not own", 409)
+    version = Listing.objects.filter(pk=id).values_list("version", flat=True).get()
+    response = JsonResponse({"amount": bid.bid, "bidder": request.user.username, "created_at": bid.created_at}, status=201)
+    response["ETag"] = etag(id, version, fields_tag(LISTING_FIELDS))
+    return response
+
+
+def serialize_comment(comment):
+    return {
+        "id": comment.pk,
+        "author": comment.author.username if comment.author else None,
+        "message": comment.message,
+        "created_at": comment.created_at,
+    }
+
+
+@require_http_methods(["GET", "POST"])
+def comments(request, id):
+    """
+    GET returns a page of the comments on a listing, newest first; POST
+    adds a comment.
+    """
+    get_object_or_404(Listing.objects.only("pk"), pk=id)
+    if request.method == "POST":
+        return comment(request, id)
+    page = timeline_page(Comment.objects.filter(listing_id=id).select_related("author"), request.GET.get("after"))
+    return JsonResponse({
+        "results": [serialize_comment(item) for item in page],
+        "next": next_url(request)(page.next_cursor) if page.next_cursor is not None else None,
+    })
+
+
+@login_required
+def comment(request, id):
+    message = str(payload(request).get("message", "")).strip()
+    if not message or len(message) > Comment._meta.get_field("message").max_length:
+        return error("The message must be between 1 and 500 characters", 400)
+    with transaction.atomic():
+        newComment = Comment.objects.create(author=request.user, listing_id=id, message=message)
+        notifications.record(NotificationEvent.COMMENT, id, actor=request.user)
+    comment_added.send(sender=Comment, listing_id=id)
+    return JsonResponse(serialize_comment(newComment), status=201)
+
+
+@require_http_methods(["GET", "POST"])
+@login_required
+def watchlist(request):
+    """
+    GET returns a page of the listings the user watches; POST adds and
+    removes many listings in one transaction.
+    """
+    if request.method == "POST":
+        return edit_watchlist(request)
+    try:
+        fields = requested_fields(request, SUMMARY_FIELDS)
+    except FieldError as e:
+        return error(str(e), 400)
+    queryset = Listing.objects.filter(pk__in=watched_ids(request.user))
+    page = keyset_page(listing_values(queryset, fields), request.GET.get("after"))
+    return collection_response(request, page, fields, next_url(request))
+
+
+def listing_ids(data, name):
+    """
+    Returns the list of listing ids sent as `name`, a JSON list or a
+    repeated form field.
+    Raises ValueError if they are not all integers.
+    """
+    if hasattr(data, "getlist"):
+        values = data.getlist(name)
+        if not all(value.isdigit() for value in values):
+            raise ValueError
+        return [int(value) for value in values]
+    value = data.get(name)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in value):
+        raise ValueError
+    return value
+
+
+def edit_watchlist(request):
+    data = payload(request)
+    try:
+        add, remove = listing_ids(data, "add"), listing_ids(data, "remove")
+    except ValueError:
+        return error('"add" and "remove" must be lists of listing ids', 400)
+    if len(add) + len(remove) > WATCHLIST_BATCH_SIZE:
+        return error(f"At most {WATCHLIST_BATCH_SIZE} listings can be changed at once", 400)
+    # Both changes are made in one transaction
+    with transaction.atomic():
+        added = watch_listings(request.user, add)
+        removed = unwatch(request.user, remove)
+    return JsonResponse({"added": sorted(added), "removed": sorted(removed)})
+
+
+@require_http_methods(["PUT", "DELETE"])
+@login_required
+def watch(request, id):
+    """
+    PUT adds a listing to the user's watchlist, DELETE removes it.
+    """
+    get_object_or_404(Listing.objects.only("pk"), pk=id)
+    if request.method == "PUT":
+        watch_listings(request.user, [id])
+    else:
+        unwatch(request.user, [id])
+    return JsonResponse({"id": id, "watching": request.method == "PUT"})
+
+
+@receiver(pre_save, sender=Listing)
+def _listing_saved(sender, instance, raw=False, **kwargs):
+    # Admin edits change the title, description, category or image the API
+    # returns; the version is raised by the UPDATE itself, so an instance
+    # loaded earlier cannot lower it
+    if not raw and not instance._state.adding:
+        instance.version = F("version") + 1
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # Connect the signal receivers that keep the caches up to date
+        from . import api, categories, conditional, live, search, watchlist
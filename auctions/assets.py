@@ -0,0 +1,191 @@
+"""
+Static files with content-hashed names, precompressed and cached forever.
+
+collectstatic copies the static files into STATIC_ROOT through
+CompressedManifestStorage, which
+
+- gives every file a name containing a hash of its content
+  (styles.css -> styles.3f2a9c0d81b4.css) and rewrites the references in
+  CSS and JavaScript files to the hashed names, recording them in
+  staticfiles.json; {% static %} then links to the hashed names;
+- fails, and with it the build, when a file refers to a file that does not
+  exist, and {% static %} raises for names that are not in the manifest;
+- writes a gzip (.gz) and, if the brotli package is installed, a brotli
+  (.br) copy next to every text file.
+
+StaticFilesMiddleware serves the collected files from memory, with the
+smallest encoding the client accepts. A hashed name changes whenever the
+file does, so those responses may be cached for a year and never
+revalidated (Cache-Control: immutable); files requested by their original
+name are cached briefly.
+
+Until collectstatic has run there is no manifest, and {% static %} links to
+the original names, which runserver serves from the app directories.
+"""
+import gzip
+import mimetypes
+import os
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth compressing
+COMPRESSIBLE = (".css", ".js", ".map", ".svg", ".txt", ".json", ".html", ".ico")
+
+# Files smaller than this are served as they are
+MIN_COMPRESS_SIZE = 256
+
+# Cache-Control of files requested by their hashed and by their original name
+IMMUTABLE = "public, max-age=31536000, immutable"
+SHORT_LIVED = "public, max-age=60"
+
+# Content-Encoding -> file extension, best first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def compress(path):
+    """
+    Writes the gzip and brotli copies of a file next to it, unless they
+    would not be smaller.
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+    if len(content) < MIN_COMPRESS_SIZE:
+        return
+    # mtime=0 keeps the output the same for the same input
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(content)
+    for extension, compressed in variants.items():
+        if len(compressed) < len(content) * 0.95:
+            with open(path + extension, "wb") as file:
+                file.write(compressed)
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """
+    Django's manifest storage, strict about missing files, which also
+    precompresses the collected text files.
+    """
+    manifest_strict = True
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+    def stored_name(self, name):
+        if not self.hashed_files and not self.exists(self.manifest_name):
+            # collectstatic has not run: link to the original names
+            return name
+        return super().stored_name(name)
+
+
+class StaticFilesMiddleware:
+    """
+    Serves the files collected into STATIC_ROOT under STATIC_URL, before
+    the session and user are loaded. Files are read once and kept in memory;
+    requests for other paths go on to the views.
+    Works under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self._lock = threading.Lock()
+        self._files = {}
+        self._hashed = None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return response if response is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        return response if response is not None else await self.get_response(request)
+
+    def serve(self, request):
+        """
+        Returns the response for a collected static file, or None.
+        """
+        if request.method not in ("GET", "HEAD") or not request.path.startswith(settings.STATIC_URL):
+            return None
+        static = self.find(request.path[len(settings.STATIC_URL):])
+        if static is None:
+            return None
+
+        # The smallest copy the client accepts
+        accepted = {part.split(";")[0].strip() for part in request.headers.get("Accept-Encoding", "").split(",")}
+        encoding = next((encoding for encoding, extension in ENCODINGS
+                         if encoding in static["content"] and encoding in accepted), None)
+        content = static["content"][encoding]
+
+        response = get_conditional_response(request, last_modified=static["mtime"])
+        if response is None:
+            response = HttpResponse(b"" if request.method == "HEAD" else content, content_type=static["type"])
+            response["Content-Length"] = len(content)
+            if encoding:
+                response["Content-Encoding"] = encoding
+        response["Last-Modified"] = http_date(static["mtime"])
+        response["Cache-Control"] = IMMUTABLE if static["hashed"] else SHORT_LIVED
+        if len(static["content"]) > 1:
+            patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    def find(self, name):
+        """
+        Returns a collected file, its compressed copies keyed by
+        Content-Encoding, its type and modification time, or None if there
+        is no such file.
+        """
+        static = self._files.get(name)
+        if static is not None or not name or not settings.STATIC_ROOT:
+            return static
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            # Outside of STATIC_ROOT
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        content = {}
+        for encoding, extension in ((None, ""), *ENCODINGS):
+            if os.path.isfile(path + extension):
+                with open(path + extension, "rb") as file:
+                    content[encoding] = file.read()
+        contentType, _ = mimetypes.guess_type(name)
+        static = {
+            "content": content,
+            "type": contentType or "application/octet-stream",
+            "mtime": int(os.path.getmtime(path)),
+            "hashed": name in self.hashed_names(),
+        }
+        with self._lock:
+            self._files[name] = static
+        return static
+
+    def hashed_names(self):
+        if self._hashed is None:
+            self._hashed = frozenset(getattr(staticfiles_storage, "hashed_files", {}).values())
+        return self._hashed
@@ -0,0 +1,169 @@
+"""
+Bid placement, bid history and closing for auction listings.
+
+A bid is accepted with a single conditional UPDATE on the listing row
+(``WHERE current_price < amount``), so two bidders racing each other can
+never both win: the database decides which UPDATE matches and the other
+one affects no rows.
+
+On top of that, bids on the same listing are serialized so accepted bids
+are recorded in strictly increasing order:
+
+- on PostgreSQL and other databases with row locks, the listing row is
+  locked with SELECT ... FOR UPDATE for the length of the transaction;
+- on SQLite, which only allows one writer at a time, transactions are
+  opened with BEGIN IMMEDIATE (see commerce/database.py) and
+  bidders in the same process take turns on a lock, so threads do not
+  fail with "database is locked" while waiting for each other.
+"""
+import math
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import categories, notifications, rankings
+from .models import Bid, Listing, NotificationEvent
+from .signals import auction_closed, bid_placed
+
+
+def parse_amount(value):
+    """
+    Converts a bid amount taken from a form into a float.
+    Returns None if the value is not a finite positive number.
+    """
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(amount) or amount <= 0:
+        return None
+    return amount
+
+
+# SQLite has a single writer, so one lock serializes every bid in the process
+_sqliteLock = threading.Lock()
+
+
+@contextmanager
+def serialized(listing_id):
+    """
+    Opens a transaction in which no other bid on the listing can run.
+    Parameters:
+        listing_id: primary key of the listing being bid on
+    """
+    connection = transaction.get_connection()
+    if connection.vendor == "sqlite":
+        with _sqliteLock, transaction.atomic():
+            yield
+    else:
+        with transaction.atomic():
+            # Lock the listing row until the transaction ends
+            list(Listing.objects.select_for_update().filter(pk=listing_id).values_list("pk"))
+            yield
+
+
+def place_bid(listing_id, user, amount):
+    """
+    Places a bid on an active listing whose end time has not passed.
+    Parameters:
+        listing_id: primary key of the listing
+        user: the user placing the bid, who must not own the listing
+        amount: the bid amount, which must be higher than the current price
+    Returns:
+        The new Bid if it was accepted, otherwise None
+    """
+    if not user.is_authenticated:
+        return None
+
+    now = timezone.now()
+    with serialized(listing_id):
+        # Raise the price, and the listing's hot score, only if this bid is
+        # still the highest one; listings past their end time take no more
+        # bids, even before the expiry worker closes them
+        updated = (
+            Listing.objects
+            .filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now), pk=listing_id, isActive=True, current_price__lt=amount)
+            .exclude(owner=user)
+            .update(
+                current_price=amount, bid_count=F("bid_count") + 1, high_bidder=user,
+                hot_score=rankings.hot_score_after_bid(now), version=F("version") + 1, updated_at=now
+            )
+        )
+        if not updated:
+            return None
+
+        # Record the bid and point the listing at it
+        bid = Bid.objects.create(user=user, bid=amount, listing_id=listing_id, created_at=now)
+        Listing.objects.filter(pk=listing_id).update(price=bid)
+        categories.price_changed(listing_id)
+        # Tell the watchers, and the bidder who lost the lead, once committed
+        notifications.record(NotificationEvent.OUTBID, listing_id, actor=user, bid=bid)
+        transaction.on_commit(lambda: bid_placed.send(sender=Listing, listing_id=listing_id))
+    return bid
+
+
+def bid_history(listing_id, limit=10, using=None):
+    """
+    Streams the highest bids placed on a listing.
+    The bids are read in (listing, -bid, created_at) order straight from
+    the covering bid_listing_amount_idx index; only the bidder's username
+    is joined in by primary key.
+    Parameters:
+        listing_id: primary key of the listing
+        limit: the maximum number of bids to return
+        using: the database to read from, instead of the routed one
+    Returns:
+        An iterator of dicts with the bid, created_at, user_id and username
+    """
+    return highest_bids(listing_id, limit, using).iterator()
+
+
+async def abid_history(listing_id, limit=10, using=None):
+    """
+    bid_history() for async views; returns a list, read with the async ORM.
+    """
+    return [row async for row in highest_bids(listing_id, limit, using)]
+
+
+def highest_bids(listing_id, limit, using=None):
+    return (
+        Bid.objects
+        .using(using)
+        .filter(listing_id=listing_id)
+        .order_by("-bid", "created_at")
+        .values("bid", "created_at", "user_id", username=F("user__username"))[:limit]
+    )
+
+
+def close_auction(listing_id):
+    """
+    Closes an active listing and records its winner.
+    The winner is the author of the highest bid in the ledger, unless that
+    is the opening bid placed by the owner.
+    Parameters:
+        listing_id: primary key of the listing
+    Returns:
+        True if the listing was open and is now closed, otherwise False
+    """
+    with serialized(listing_id):
+        listing = Listing.objects.filter(pk=listing_id, isActive=True).values("owner_id", "category_id").first()
+        if listing is None:
+            return False
+
+        winner_id = None
+        for top in bid_history(listing_id, limit=1):
+            if top["user_id"] != listing["owner_id"]:
+                winner_id = top["user_id"]
+
+        # Only close the listing if no one else closed it in the meantime
+        closed = Listing.objects.filter(pk=listing_id, isActive=True).update(
+            isActive=False, high_bidder_id=winner_id, version=F("version") + 1, updated_at=timezone.now()
+        )
+        if closed:
+            categories.listings_closed([listing["category_id"]])
+            notifications.record(NotificationEvent.CLOSED, listing_id)
+            transaction.on_commit(lambda: auction_closed.send(sender=Listing, listing_id=listing_id))
+    return bool(closed)
@@ -0,0 +1,175 @@
+"""
+Category summaries: the number of active listings in every category and
+the lowest and highest current price among them.
+
+The summaries are counters stored on the category rows and kept up to
+date by the writes that change them, in the same transaction:
+
+- a new listing adds one to its category (post_save receiver below);
+- an accepted bid refreshes the prices of its listing's category
+  (bidding.place_bid);
+- closing a listing, by hand or when it expires, removes one from its
+  category (bidding.close_auction, expiry.close_batch).
+
+The lowest and highest prices are read back from the partial
+listing_active_price_idx index, so keeping them costs two index lookups
+per write and the pages never count or aggregate listings.
+
+The list of categories shown in the category menus is cached in each
+process and tagged with a version read from the database: every write to a
+category row increments its version column in the same statement, and the
+list's version combines the number of categories, the sum of their
+versions and the highest id. Once a write commits, every process,
+including web workers that did not make it, sees a version it does not
+hold and reloads the list, whatever cache backend is configured.
+"""
+import threading
+from collections import Counter
+
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Category, Listing
+
+# The parts of the list's version: deleting a category lowers the count,
+# adding one raises the highest id and any other change raises the sum of
+# the row versions
+VERSION_PARTS = {"count": Count("pk"), "versions": Sum("version"), "last": Max("pk")}
+
+_lock = threading.Lock()
+_cached = {"version": None, "categories": ()}
+
+
+def version():
+    """
+    Returns the current version of the category list, read from the
+    primary with a single aggregate over the category table.
+    """
+    return tuple(Category.objects.using("default").aggregate(**VERSION_PARTS).values())
+
+
+async def aversion():
+    """
+    version() for async views.
+    """
+    return tuple((await Category.objects.using("default").aaggregate(**VERSION_PARTS)).values())
+
+
+def all_categories():
+    """
+    Returns every category, with its summary, ordered by name.
+    The list is only read from the database when its version has changed.
+    """
+    current = version()
+    categories = cached(current)
+    if categories is None:
+        categories = store(current, tuple(category_list()))
+    return categories
+
+
+async def aall_categories():
+    """
+    all_categories() for async views, read with the async ORM.
+    """
+    current = await aversion()
+    categories = cached(current)
+    if categories is None:
+        categories = store(current, tuple([category async for category in category_list()]))
+    return categories
+
+
+def category_list():
+    # Always read from the primary: the list is shared by every request of
+    # the process until the next change, so it must not lag behind
+    return Category.objects.using("default").order_by("categoryName")
+
+
+def cached(current):
+    with _lock:
+        if _cached["version"] == current:
+            return _cached["categories"]
+    return None
+
+
+def store(current, categories):
+    with _lock:
+        _cached["version"] = current
+        _cached["categories"] = categories
+    return categories
+
+
+def refresh(categories, delta=0):
+    """
+    Recomputes the lowest and highest prices of some categories and
+    adjusts their active listing counts.
+    Parameters:
+        categories: a Category queryset
+        delta: the number of listings that became active (or, if negative,
+               closed) in each of the categories
+    """
+    active = Listing.objects.filter(isActive=True, category=OuterRef("pk")).values("current_price")
+    changes = {
+        "min_price": Subquery(active.order_by("current_price")[:1]),
+        "max_price": Subquery(active.order_by("-current_price")[:1]),
+    }
+    if delta:
+        changes["active_count"] = F("active_count") + delta
+    categories.update(**changes, version=F("version") + 1)
+
+
+def price_changed(listing_id):
+    """
+    Refreshes the prices of the category of a listing, after a bid.
+    """
+    listings = Listing.objects.filter(pk=listing_id).values("category_id")
+    refresh(Category.objects.filter(pk=Subquery(listings)))
+
+
+def listings_closed(category_ids):
+    """
+    Removes closed listings from the summaries of their categories.
+    Parameters:
+        category_ids: the category id of every closed listing, repeated
+                      once per listing; None for listings without one
+    """
+    # One UPDATE per distinct number of listings closed in a category
+    byCount = {}
+    for categoryId, closed in Counter(category_ids).items():
+        if categoryId is not None:
+            byCount.setdefault(closed, []).append(categoryId)
+    for closed, ids in byCount.items():
+        refresh(Category.objects.filter(pk__in=ids), -closed)
+
+
+def rebuild():
+    """
+    Recounts the summaries of every category from scratch, for data loaded
+    without going through the ORM's save(), like bulk_create.
+    """
+    active = Listing.objects.filter(isActive=True, category=OuterRef("pk"))
+    counts = active.order_by().values("category").annotate(count=Count("pk")).values("count")
+    Category.objects.update(active_count=Coalesce(Subquery(counts), 0))
+    refresh(Category.objects.all())
+
+
+@receiver(post_save, sender=Listing)
+def _listing_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.isActive and instance.category_id is not None:
+        refresh(Category.objects.filter(pk=instance.category_id), 1)
+
+
+@receiver(post_delete, sender=Listing)
+def _listing_deleted(sender, instance, **kwargs):
+    if instance.isActive and instance.category_id is not None:
+        refresh(Category.objects.filter(pk=instance.category_id), -1)
+
+
+@receiver(pre_save, sender=Category)
+def _category_saved(sender, instance, raw=False, **kwargs):
+    # Categories are renamed by hand in the admin; the version is raised
+    # by the UPDATE itself, so an instance loaded earlier cannot lower it
+    if not raw and not instance._state.adding:
+        instance.version = F("version") + 1
+
@@ -0,0 +1,200 @@
+"""
+Conditional GET and HTTP caching headers for the HTML pages.
+
+A listing page is validated against the listing's updated_at, which is set
+by bids, comments, closing and new thumbnails, and against whether its
+auction is still open: the page stops offering bids once ends_at passes,
+before the expiry worker closes the listing. The listing feeds are
+validated against the most recent updated_at of any listing, which is read
+from the listing_updated_idx index. Both are combined with the user and
+their watchlist, which change the buttons and badges on the page, into the
+ETag, with the version of the most watched ranking when the feed is sorted
+by it; Django's condition() decorator then answers If-None-Match and
+If-Modified-Since with a 304 before the view runs. Django calls the ETag
+functions synchronously, even for async views, so condition() below runs
+them in a thread for those.
+
+Pages served to anonymous visitors are the same for everyone and may be
+stored by shared caches for AUCTIONS_SHARED_CACHE_SECONDS, or until the
+auction on the page ends if that is sooner; pages of
+logged-in users are private. Both vary on the session cookie.
+"""
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators import http
+
+from . import rankings
+from .models import Listing
+from .pagination import EPOCH
+from .signals import comment_added
+
+
+def _micros(moment):
+    # Last-Modified only has whole seconds, the ETag keeps microseconds
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def user_tag(request, watchlist=True):
+    """
+    Returns the part of an ETag that depends on who is looking: the user
+    and, on pages that show it, the listings they watch.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return "0"
+    if not watchlist:
+        return str(user.pk)
+    # Raised by every watchlist change, and loaded with the user
+    return f"{user.pk}-{user.watchlist_version}"
+
+
+def listings_changed_at():
+    """
+    Returns when any listing last changed, or None if there are none.
+    """
+    return Listing.objects.aggregate(changed=Max("updated_at"))["changed"]
+
+
+def feed_etag(request, *args, **kwargs):
+    changed = listings_changed_at()
+    tag = f"{_micros(changed) if changed else 0}.{user_tag(request)}"
+    if request.GET.get("sort") == "watched":
+        # Watchlist changes reorder the ranking without touching a listing
+        tag += f".{rankings.watched_version()}"
+    return tag
+
+
+def closed_feed_etag(request, *args, **kwargs):
+    # The closed listings page has no watchlist badges
+    changed = listings_changed_at()
+    return f"{_micros(changed) if changed else 0}.{user_tag(request, watchlist=False)}"
+
+
+def listing_state(request, id):
+    # Looked up once per request, for the ETag, Last-Modified and the
+    # shared cache lifetime
+    if not hasattr(request, "listingState"):
+        request.listingState = Listing.objects.filter(pk=id).values("updated_at", "ends_at", "isActive").first()
+    return request.listingState
+
+
+def listing_changed_at(request, id):
+    state = listing_state(request, id)
+    return state and state["updated_at"]
+
+
+def ended_at(state):
+    """
+    Returns when an active listing's auction ended, or None if it is still
+    open; until the expiry worker closes it, that is not in updated_at.
+    """
+    endsAt = state["ends_at"]
+    if state["isActive"] and endsAt is not None and endsAt <= timezone.now():
+        return endsAt
+    return None
+
+
+def listing_modified(request, id):
+    # The page stops offering bids when the auction ends
+    state = listing_state(request, id)
+    if state is None:
+        return None
+    return max(state["updated_at"], ended_at(state) or state["updated_at"])
+
+
+def listing_etag(request, id):
+    state = listing_state(request, id)
+    if state is None:
+        return None
+    isOpen = state["isActive"] and ended_at(state) is None
+    return f"{id}.{_micros(state['updated_at'])}.{int(isOpen)}.{user_tag(request)}"
+
+
+def closed_listing_etag(request, id):
+    # The closed listing page has no watchlist button
+    changed = listing_changed_at(request, id)
+    if changed is None:
+        return None
+    return f"{id}.{_micros(changed)}.{user_tag(request, watchlist=False)}"
+
+
+def condition(etag_func=None, last_modified_func=None):
+    """
+    Django's condition() decorator, for sync and async views.
+    """
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return http.condition(etag_func, last_modified_func)(view)
+
+        # The functions query the database, so for async views they are run
+        # in a thread first and their results handed to Django's decorator
+        checked = http.condition(
+            etag_func=etag_func and (lambda request, *args, **kwargs: request.validators[0]),
+            last_modified_func=last_modified_func and (lambda request, *args, **kwargs: request.validators[1]),
+        )(view)
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            def validators():
+                return (
+                    etag_func(request, *args, **kwargs) if etag_func else None,
+                    last_modified_func(request, *args, **kwargs) if last_modified_func else None,
+                )
+            request.validators = await sync_to_async(validators)()
+            return await checked(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def shared_cache_seconds(request):
+    """
+    Returns how long shared caches may keep an anonymous page: no longer
+    than AUCTIONS_SHARED_CACHE_SECONDS, nor past the end of the auction
+    shown on it, when the page stops offering bids.
+    """
+    seconds = settings.AUCTIONS_SHARED_CACHE_SECONDS
+    state = getattr(request, "listingState", None)
+    if state and state["isActive"] and state["ends_at"] is not None:
+        left = (state["ends_at"] - timezone.now()).total_seconds()
+        if left > 0:
+            seconds = min(seconds, int(left))
+    return seconds
+
+
+def cacheable(view):
+    """
+    Sets Cache-Control and Vary on the responses of a page: shared caches
+    may keep anonymous pages, pages of logged-in users are private.
+    The user must already be loaded when an async view returns.
+    """
+    def patch(request, response):
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=0, s_maxage=shared_cache_seconds(request))
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            return patch(request, await view(request, *args, **kwargs))
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return patch(request, view(request, *args, **kwargs))
+    return wrapper
+
+
+@receiver(comment_added)
+def _touch_listing(sender, listing_id, **kwargs):
+    # Comments are stored in their own table, so the listing is marked as
+    # changed explicitly
+    Listing.objects.filter(pk=listing_id).update(updated_at=timezone.now())
@@ -0,0 +1,71 @@
+"""
+Closes auctions whose end time has passed.
+
+Due listings are found with the partial ends_at index and closed in
+batches: only one batch of ids is held in memory at a time and each batch
+is closed with a single UPDATE, so a backlog of overdue listings is worked
+through without loading it.
+
+The winner is the listing's high_bidder, which place_bid updates in the
+same row and statement as the price, so it always matches the highest bid
+in the ledger.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import categories, notifications
+from .models import Listing
+from .signals import auction_closed
+
+# Number of listings closed per transaction
+BATCH_SIZE = 500
+
+
+def due_listings(now):
+    """
+    Returns the open listings whose end time has passed.
+    """
+    return Listing.objects.filter(isActive=True, ends_at__lte=now)
+
+
+def close_due_auctions(now=None, batch_size=BATCH_SIZE):
+    """
+    Closes every open listing whose end time has passed.
+    Parameters:
+        now: the time to compare end times with, defaults to the current time
+        batch_size: the number of listings closed per transaction
+    Returns:
+        The number of listings closed
+    """
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        ids = list(due_listings(now).order_by("ends_at").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return closed
+        closed += close_batch(ids, now)
+
+
+def close_batch(ids, now):
+    """
+    Closes the listings with the given ids that are still open and due.
+    Returns the number of listings closed.
+    """
+    with transaction.atomic():
+        closing = due_listings(now).filter(pk__in=ids)
+        # The listings this batch closes and their categories, locked so no
+        # one else closes them first where the database has row locks
+        rows = list(closing.select_for_update().values_list("pk", "category_id"))
+        closed = closing.update(
+            isActive=False, version=F("version") + 1, updated_at=timezone.now()
+        )
+        categories.listings_closed([categoryId for pk, categoryId in rows])
+        notifications.record_closed([pk for pk, categoryId in rows])
+        transaction.on_commit(lambda: _announce(ids))
+    return closed
+
+
+def _announce(ids):
+    for listing_id in ids:
+        auction_closed.send(sender=Listing, listing_id=listing_id)
@@ -0,0 +1,103 @@
+"""
+Cache of the rendered parts of the listing page that are the same for
+every visitor: the listing body (details, price and bid history) and the
+comment list.
+
+Fragments are stored in Django's cache framework (local memory by default,
+Redis when configured in CACHES) under keys that carry the listing's
+updated_at, which bids, comments, closing and new thumbnails all move
+forward. A change therefore never has to delete anything: the next request
+reads the new updated_at and looks up a new key, and a request that read
+the listing before the change and stores its render afterwards only fills
+a key no one asks for any more. Callers must read updated_at before the
+data they render, so an entry is never older than its key. Per-user parts
+of the page, like the owner and watchlist buttons, are rendered on top of
+them.
+"""
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .pagination import EPOCH
+
+# Superseded fragments are never read again, the timeout evicts them
+FRAGMENT_TIMEOUT = 60 * 60
+
+# Templates of the cached fragments, by fragment name
+FRAGMENTS = {
+    "body": "auctions/listingBody.html",
+    "comments": "auctions/listingComments.html",
+}
+
+_statsLock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def fragment_key(listing_id, name, changed_at):
+    """
+    Returns the cache key of a fragment of a listing as of its updated_at.
+    """
+    return f"auctions:listing:{listing_id}:{name}:{(changed_at - EPOCH) // timedelta(microseconds=1)}"
+
+
+def render_fragment(listing_id, name, changed_at, context):
+    """
+    Returns a rendered fragment of a listing, from the cache if possible.
+    Parameters:
+        listing_id: primary key of the listing
+        name: the fragment name, a key of FRAGMENTS
+        changed_at: the listing's updated_at, read before anything the
+                    context renders
+        context: a callable returning the template context; it is only
+                 called on a cache miss, so database queries can be put off
+    Returns:
+        The rendered HTML
+    """
+    key = fragment_key(listing_id, name, changed_at)
+    html = cache.get(key)
+    with _statsLock:
+        _stats["hits" if html is not None else "misses"] += 1
+    if html is None:
+        html = render_to_string(FRAGMENTS[name], context())
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html
+
+
+async def arender_fragment(listing_id, name, changed_at, context):
+    """
+    render_fragment() for async views: `context` is a coroutine function,
+    only awaited on a cache miss.
+    """
+    key = fragment_key(listing_id, name, changed_at)
+    html = await cache.aget(key)
+    with _statsLock:
+        _stats["hits" if html is not None else "misses"] += 1
+    if html is None:
+        html = render_to_string(FRAGMENTS[name], await context())
+        await cache.aset(key, html, FRAGMENT_TIMEOUT)
+    return html
+
+
+def stats():
+    """
+    Returns the number of fragment cache hits and misses in this process.
+    """
+    with _statsLock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    """
+    Resets the hit and miss counters.
+    """
+    with _statsLock:
+        _stats["hits"] = _stats["misses"] = 0
+
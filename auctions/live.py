@@ -0,0 +1,240 @@
+"""
+Live price updates for listing pages, streamed as Server-Sent Events.
+
+Every process keeps one fan-out per listing: when a bid is placed or the
+auction is closed, a single snapshot of the listing is published and copied
+to the queue of every client watching it, instead of each client polling
+the database.
+
+The broker that carries the snapshots is pluggable through the
+AUCTIONS_LIVE_BROKER setting:
+
+- InMemoryBroker (the default) fans out within one process, which is
+  enough for a single ASGI worker and for tests;
+- RedisBroker publishes through Redis pub/sub so every worker process
+  sees the updates; each process subscribes once per watched listing and
+  fans out locally.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Listing
+from .signals import auction_closed, bid_placed
+
+# Seconds between keep-alive comments sent to idle clients
+HEARTBEAT_INTERVAL = 15
+
+# Updates a slow client may fall behind before older ones are dropped
+QUEUE_SIZE = 16
+
+# Milliseconds a client served a single snapshot waits before asking again
+RETRY_INTERVAL = 15000
+
+
+class InMemoryBroker:
+    """
+    Fans out listing updates to the subscribers of the current process.
+    publish() may be called from any thread; subscribers are asyncio queues
+    that are fed on the event loop they were created on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, listing_id, event):
+        """
+        Sends an update to everyone watching a listing.
+        """
+        self.deliver(listing_id, event)
+
+    def deliver(self, listing_id, event):
+        """
+        Copies an update to the queue of every local subscriber of a listing.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(listing_id, ()))
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, event)
+
+    def subscribe(self, listing_id):
+        """
+        Registers a new subscriber and returns its queue.
+        Must be called from the event loop that will read the queue.
+        """
+        queue = asyncio.Queue(QUEUE_SIZE)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(listing_id, set())
+            first = not subscribers
+            subscribers.add((queue, asyncio.get_running_loop()))
+        if first:
+            self.first_subscriber(listing_id)
+        return queue
+
+    def unsubscribe(self, listing_id, queue):
+        """
+        Removes a subscriber added by subscribe().
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(listing_id, set())
+            subscribers.difference_update({s for s in subscribers if s[0] is queue})
+            last = not subscribers
+            if last:
+                self._subscribers.pop(listing_id, None)
+        if last:
+            self.last_subscriber(listing_id)
+
+    def subscriber_count(self, listing_id):
+        """
+        Returns the number of local subscribers of a listing.
+        """
+        with self._lock:
+            return len(self._subscribers.get(listing_id, ()))
+
+    def first_subscriber(self, listing_id):
+        """
+        Called when a listing gets its first local subscriber.
+        """
+
+    def last_subscriber(self, listing_id):
+        """
+        Called when the last local subscriber of a listing leaves.
+        """
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Shares listing updates between processes through Redis pub/sub.
+    The Redis URL is read from the REDIS_URL setting. Requires the redis
+    package.
+    """
+
+    def __init__(self):
+        super().__init__()
+        import redis
+        import redis.asyncio
+
+        self._url = settings.REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+        self._asyncClient = redis.asyncio.Redis.from_url(self._url)
+        self._listeners = {}
+
+    def channel(self, listing_id):
+        return f"auctions:listing:{listing_id}"
+
+    def publish(self, listing_id, event):
+        self._client.publish(self.channel(listing_id), json.dumps(event))
+
+    def first_subscriber(self, listing_id):
+        # One Redis subscription per listing, shared by the local subscribers
+        self._listeners[listing_id] = asyncio.get_running_loop().create_task(self._listen(listing_id))
+
+    def last_subscriber(self, listing_id):
+        listener = self._listeners.pop(listing_id, None)
+        if listener is not None:
+            listener.cancel()
+
+    async def _listen(self, listing_id):
+        async with self._asyncClient.pubsub() as pubsub:
+            await pubsub.subscribe(self.channel(listing_id))
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.deliver(listing_id, json.loads(message["data"]))
+
+
+def _offer(queue, event):
+    # Drop the oldest update rather than block the publisher on a slow client;
+    # every update is a full snapshot, so only the latest one matters
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+_broker = None
+_brokerLock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns the broker configured in AUCTIONS_LIVE_BROKER, created on first use.
+    """
+    global _broker
+    with _brokerLock:
+        if _broker is None:
+            path = getattr(settings, "AUCTIONS_LIVE_BROKER", "auctions.live.InMemoryBroker")
+            _broker = import_string(path)()
+        return _broker
+
+
+def snapshot(listing):
+    """
+    Returns the live state of a listing from a dict of its field values.
+    """
+    return {
+        "id": listing["id"],
+        "price": listing["current_price"],
+        "bids": listing["bid_count"],
+        "closed": not listing["isActive"],
+    }
+
+
+SNAPSHOT_FIELDS = ("id", "current_price", "bid_count", "isActive")
+
+
+def format_event(event):
+    """
+    Formats an update as a Server-Sent Event.
+    """
+    return f"event: listing\ndata: {json.dumps(event)}\n\n"
+
+
+def single_event(initial):
+    """
+    Formats a snapshot as a complete event stream that tells the client
+    when to reconnect, for servers that cannot hold a stream open.
+    """
+    return f"retry: {RETRY_INTERVAL}\n{format_event(initial)}"
+
+
+async def stream(listing_id, initial):
+    """
+    Yields Server-Sent Events for a listing until the client disconnects
+    or the auction closes.
+    Parameters:
+        listing_id: primary key of the listing
+        initial: the current snapshot of the listing, sent first
+    """
+    broker = get_broker()
+    queue = broker.subscribe(listing_id)
+    try:
+        yield format_event(initial)
+        closed = initial["closed"]
+        while not closed:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+            closed = event["closed"]
+    finally:
+        broker.unsubscribe(listing_id, queue)
+
+
+@receiver(bid_placed)
+@receiver(auction_closed)
+def _publish(sender, listing_id, **kwargs):
+    broker = get_broker()
+    # Nothing to publish if no one in this process is watching and the
+    # broker does not share updates with other processes
+    if type(broker) is InMemoryBroker and not broker.subscriber_count(listing_id):
+        return
+    listing = Listing.objects.filter(pk=listing_id).values(*SNAPSHOT_FIELDS).first()
+    if listing is not None:
+        broker.publish(listing_id, snapshot(listing))
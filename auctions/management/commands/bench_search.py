@@ -0,0 +1,77 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from auctions.models import Category, Listing
+from auctions.search import search_listings
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares full-text search with icontains scans on synthetic listings. "
+        "Runs against a throwaway test database, the project database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="number of synthetic listings")
+        parser.add_argument("--queries", type=int, default=50, help="number of searches to time")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        oldName = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            vocabulary = self.populate(rng, options["rows"], options["batch_size"])
+            words = [rng.choice(vocabulary) for _ in range(options["queries"])]
+            self.report("full-text", [self.time(lambda: search_listings(word)) for word in words])
+            self.report("icontains", [self.time(lambda: self.scan(word)) for word in words])
+        finally:
+            connection.creation.destroy_test_db(oldName, verbosity=0)
+
+    def populate(self, rng, rows, batchSize):
+        # A Zipf-like vocabulary: a few words are common, most are rare
+        vocabulary = [f"item{i}" for i in range(20_000)]
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+        categories = [Category.objects.create(categoryName=f"Category {i}") for i in range(20)]
+
+        start = time.perf_counter()
+        for offset in range(0, rows, batchSize):
+            Listing.objects.bulk_create([
+                Listing(
+                    title=" ".join(rng.choices(vocabulary, cum_weights=weights, k=4)),
+                    description=" ".join(rng.choices(vocabulary, cum_weights=weights, k=40)),
+                    current_price=rng.randint(1, 1000),
+                    isActive=rng.random() < 0.8,
+                    category=rng.choice(categories),
+                )
+                for _ in range(min(batchSize, rows - offset))
+            ])
+        self.stdout.write(f"Created {rows} listings in {time.perf_counter() - start:.1f}s")
+        return vocabulary[:2_000]
+
+    def scan(self, word):
+        # What a search would cost without a full-text index
+        return list(
+            Listing.objects.filter(Q(title__icontains=word) | Q(description__icontains=word), isActive=True)
+            .select_related("category", "owner")
+            .order_by("pk")[:24]
+        )
+
+    def time(self, search):
+        start = time.perf_counter()
+        search()
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, name, timings):
+        timings.sort()
+        p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f"{name:>10}: mean {statistics.mean(timings):8.2f} ms"
+            f"  p50 {statistics.median(timings):8.2f} ms  p95 {p95:8.2f} ms"
+        )
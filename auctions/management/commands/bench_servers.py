@@ -0,0 +1,244 @@
+import asyncio
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .load_scenario import percentile
+
+# Command line of every server compared, one after the other; {host},
+# {port}, {workers} and {threads} are filled in from the options
+SERVERS = {
+    # gthread workers: a fixed pool of threads per worker, and a thread is
+    # held by a request from its first byte until its response is sent
+    "wsgi": [
+        "gunicorn", "commerce.wsgi:application", "--worker-class", "gthread",
+        "--workers", "{workers}", "--threads", "{threads}", "--bind", "{host}:{port}",
+    ],
+    # An event loop per worker: slow clients hold a coroutine, not a thread
+    "asgi": [
+        "uvicorn", "commerce.asgi:application", "--workers", "{workers}",
+        "--host", "{host}", "--port", "{port}", "--no-access-log",
+    ],
+}
+
+LISTING_LINK = re.compile(rb'href="/listing/(\d+)"')
+
+# Extra headers a slow client sends one at a time
+SLOW_HEADERS = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the read pages served through WSGI (gunicorn) and ASGI (uvicorn) while many "
+        "slow clients trickle their requests in and read their responses slowly. Reports the "
+        "throughput and latency seen by normal clients meanwhile. Starts each server on a free "
+        "port against the configured database, or benchmarks running servers given with --url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", default="wsgi,asgi", help=f"servers to start, out of {', '.join(SERVERS)}")
+        parser.add_argument("--url", action="append", default=[], metavar="NAME=URL",
+                            help="benchmark a running server instead of starting one; may be repeated")
+        parser.add_argument("--workers", type=int, default=1, help="worker processes of every server")
+        parser.add_argument("--threads", type=int, default=8, help="threads of every WSGI worker")
+        parser.add_argument("--clients", type=int, default=10, help="normal clients, requesting pages back to back")
+        parser.add_argument("--slow-clients", type=int, default=50)
+        parser.add_argument("--slow-delay", type=float, default=0.5,
+                            help="seconds a slow client waits between header lines and between response chunks")
+        parser.add_argument("--duration", type=float, default=10, help="seconds every server is measured")
+        parser.add_argument("--timeout", type=float, default=10, help="seconds before a request counts as failed")
+        parser.add_argument("--paths", default="/,/listing/{listing},/watchlist",
+                            help="pages requested, {listing} is a listing linked from the index")
+
+    def handle(self, *args, **options):
+        targets = []
+        for value in options["url"]:
+            name, _, url = value.partition("=")
+            if not url:
+                raise CommandError(f"--url takes NAME=URL, got {value!r}")
+            targets.append((name, url))
+
+        rows = []
+        if targets:
+            for name, url in targets:
+                rows.append((name, self.measure(url, options)))
+        else:
+            for name in options["servers"].split(","):
+                if name not in SERVERS:
+                    raise CommandError(f"Unknown server {name!r}, choose from {', '.join(SERVERS)}")
+                if shutil.which(SERVERS[name][0]) is None:
+                    self.stdout.write(f"Skipping {name}: {SERVERS[name][0]} is not installed")
+                    continue
+                rows.append((name, self.serve(name, options)))
+        self.report(rows, options)
+
+    def serve(self, name, options):
+        # Start the server on a free port, measure it and stop it
+        host = "127.0.0.1"
+        with socket.socket() as probe:
+            probe.bind((host, 0))
+            port = probe.getsockname()[1]
+        command = [part.format(host=host, port=port, **options) for part in SERVERS[name]]
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=dict(os.environ, PYTHONPATH=str(settings.BASE_DIR)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.waitForServer(server, host, port, name)
+            return self.measure(f"http://{host}:{port}", options)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def waitForServer(self, server, host, port, name, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{name} exited with status {server.returncode}")
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"{name} did not start listening within {timeout}s")
+
+    def measure(self, url, options):
+        match = re.match(r"https?://([^/:]+)(?::(\d+))?", url)
+        if match is None:
+            raise CommandError(f"Cannot parse the URL {url!r}")
+        host, port = match.group(1), int(match.group(2) or 80)
+        return asyncio.run(Load(host, port, options).run())
+
+    def report(self, rows, options):
+        self.stdout.write(
+            f"{options['clients']} clients, {options['slow_clients']} slow clients, {options['duration']:.0f}s per server"
+        )
+        self.stdout.write(
+            f"{'server':<10}{'req/s':>8}{'errors':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'slow done':>11}{'slow errors':>13}"
+        )
+        for name, results in rows:
+            samples = results["latencies"]
+            if samples:
+                latency = (
+                    f"{statistics.mean(samples):>9.1f}{percentile(samples, 0.50):>9.1f}"
+                    f"{percentile(samples, 0.95):>9.1f}{percentile(samples, 0.99):>9.1f}"
+                )
+            else:
+                latency = f"{'-':>9}" * 4
+            self.stdout.write(
+                f"{name:<10}{len(samples) / results['elapsed']:>8.1f}{results['errors']:>8}{latency}"
+                f"{results['slow']:>11}{results['slowErrors']:>13}"
+            )
+        self.stdout.write("Latencies of the normal clients in milliseconds")
+
+
+class Load:
+    """
+    The clients run against one server: normal clients requesting the pages
+    back to back, and slow clients holding connections open.
+    """
+
+    def __init__(self, host, port, options):
+        self.host = host
+        self.port = port
+        self.options = options
+        self.latencies = []
+        self.errors = 0
+        self.slow = 0
+        self.slowErrors = 0
+
+    async def run(self):
+        paths = await self.paths()
+        self.deadline = time.monotonic() + self.options["duration"]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(self.client(paths, i) for i in range(self.options["clients"])),
+            *(self.slowClient(paths, i) for i in range(self.options["slow_clients"])),
+        )
+        return {
+            "elapsed": time.perf_counter() - start,
+            "latencies": self.latencies,
+            "errors": self.errors,
+            "slow": self.slow,
+            "slowErrors": self.slowErrors,
+        }
+
+    async def paths(self):
+        paths = self.options["paths"].split(",")
+        if any("{listing}" in path for path in paths):
+            # Pick a listing linked from the index page
+            status, body = await self.fetch("/")
+            match = LISTING_LINK.search(body)
+            if match is None:
+                raise CommandError("The index page links no listing; run seed_data first")
+            paths = [path.format(listing=int(match.group(1))) for path in paths]
+        return paths
+
+    async def client(self, paths, offset):
+        i = offset
+        while time.monotonic() < self.deadline:
+            start = time.perf_counter()
+            try:
+                status, body = await self.fetch(paths[i % len(paths)])
+            except (OSError, asyncio.TimeoutError, ValueError):
+                status = None
+            if status == 200:
+                self.latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                self.errors += 1
+            i += 1
+
+    async def slowClient(self, paths, offset):
+        i = offset
+        while time.monotonic() < self.deadline:
+            try:
+                status, body = await self.fetch(paths[i % len(paths)], self.options["slow_delay"])
+            except (OSError, asyncio.TimeoutError, ValueError):
+                status = None
+            if status == 200:
+                self.slow += 1
+            else:
+                self.slowErrors += 1
+            i += 1
+
+    async def fetch(self, path, slowDelay=0):
+        """
+        Requests a page over a new connection and returns its status and
+        body. A slow request sends its headers one line at a time and reads
+        the response in small chunks, pausing `slowDelay` seconds in between.
+        """
+        timeout = self.options["timeout"] + (SLOW_HEADERS + 1) * slowDelay
+        return await asyncio.wait_for(self.exchange(path, slowDelay), timeout)
+
+    async def exchange(self, path, slowDelay):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: close\r\n".encode())
+            for i in range(SLOW_HEADERS if slowDelay else 0):
+                await writer.drain()
+                await asyncio.sleep(slowDelay)
+                writer.write(f"X-Slow-{i}: 1\r\n".encode())
+            writer.write(b"\r\n")
+            await writer.drain()
+
+            chunks = []
+            while chunk := await reader.read(1024 if slowDelay else 65536):
+                chunks.append(chunk)
+                if slowDelay:
+                    await asyncio.sleep(slowDelay / SLOW_HEADERS)
+        finally:
+            writer.close()
+        response = b"".join(chunks)
+        head, _, body = response.partition(b"\r\n\r\n")
+        # The status line reads "HTTP/1.1 200 OK"
+        statusLine = head.split(b" ", 2)
+        if len(statusLine) < 2:
+            raise ValueError("The server closed the connection without a response")
+        return int(statusLine[1]), body
@@ -0,0 +1,164 @@
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from auctions.bidding import place_bid
+from auctions.models import Comment, Listing, User
+from auctions.watchlist import unwatch, watch
+
+OPERATIONS = ("bid", "comment", "watch")
+
+# Environment of every mode compared by --compare; the PostgreSQL modes
+# reuse DATABASE_URL and only run when it points at PostgreSQL
+MODES = {
+    "sqlite-rollback": {"DATABASE_URL": "sqlite:///db.sqlite3", "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL"},
+    "sqlite-wal": {"DATABASE_URL": "sqlite:///db.sqlite3", "SQLITE_JOURNAL_MODE": "WAL", "SQLITE_SYNCHRONOUS": "NORMAL"},
+    "postgres": {"DB_POOL_SIZE": "0"},
+    "postgres-pool": {"DB_POOL_SIZE": "{threads}"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures write throughput with concurrent bidders, commenters and watchlist toggles. "
+        "Runs against a throwaway test database of the configured backend, or compares every "
+        "database mode with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--operations", type=int, default=200, help="writes made by every thread")
+        parser.add_argument("--listings", type=int, default=10, help="listings the writes are spread over")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--compare", action="store_true", help="run once per database mode and compare")
+        parser.add_argument("--json", action="store_true", help="print the results as JSON")
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            return self.compare(options)
+
+        if connection.vendor == "sqlite":
+            # The default SQLite test database lives in memory, where the
+            # journal mode makes no difference; benchmark a real file instead
+            directory = tempfile.TemporaryDirectory()
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(directory.name, "bench.sqlite3")
+        oldName = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            listings, users = self.populate(options)
+            results = self.run(listings, users, options)
+        finally:
+            connection.creation.destroy_test_db(oldName, verbosity=0)
+            if connection.vendor == "sqlite":
+                directory.cleanup()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results))
+        else:
+            self.report([(self.describe(), results)])
+
+    def describe(self):
+        if connection.vendor == "sqlite":
+            return f"sqlite ({os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').lower()})"
+        if settings.DATABASES["default"]["OPTIONS"].get("pool"):
+            return f"{connection.vendor} (pool)"
+        return connection.vendor
+
+    def populate(self, options):
+        users = User.objects.bulk_create([User(username=f"writer{i}") for i in range(options["threads"] * 2)])
+        listings = Listing.objects.bulk_create([
+            Listing(title=f"Listing {i}", description="Benchmark listing", owner=users[0], current_price=1)
+            for i in range(options["listings"])
+        ])
+        return [listing.pk for listing in listings], users[1:]
+
+    def run(self, listings, users, options):
+        timings = {name: [] for name in OPERATIONS}
+        errors = {name: 0 for name in OPERATIONS}
+        lock = threading.Lock()
+        # Rising amounts, so most bids outbid the previous one
+        amounts = itertools.count(2)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            user = rng.choice(users)
+            try:
+                for _ in range(options["operations"]):
+                    name = rng.choice(OPERATIONS)
+                    listingId = rng.choice(listings)
+                    start = time.perf_counter()
+                    try:
+                        if name == "bid":
+                            place_bid(listingId, user, float(next(amounts)))
+                        elif name == "comment":
+                            Comment.objects.create(listing_id=listingId, author=user, message="Benchmark comment")
+                        elif not unwatch(user, [listingId]):
+                            watch(user, [listingId])
+                    except DatabaseError:
+                        with lock:
+                            errors[name] += 1
+                        continue
+                    with lock:
+                        timings[name].append((time.perf_counter() - start) * 1000)
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            list(pool.map(worker, range(options["seed"], options["seed"] + options["threads"])))
+        elapsed = time.perf_counter() - start
+
+        return {
+            "elapsed": elapsed,
+            "writes": sum(len(samples) for samples in timings.values()),
+            "errors": sum(errors.values()),
+            "operations": {
+                name: {
+                    "count": len(samples),
+                    "errors": errors[name],
+                    "p50": statistics.median(samples) if samples else 0,
+                    "p95": sorted(samples)[max(int(len(samples) * 0.95) - 1, 0)] if samples else 0,
+                }
+                for name, samples in timings.items()
+            },
+        }
+
+    def compare(self, options):
+        postgres = settings.DATABASES["default"]["ENGINE"].endswith("postgresql")
+        rows = []
+        for mode, variables in MODES.items():
+            if mode.startswith("postgres") and not postgres:
+                self.stdout.write(f"Skipping {mode}: DATABASE_URL does not point at PostgreSQL")
+                continue
+            env = dict(os.environ, **{name: value.format(**options) for name, value in variables.items()})
+            command = [
+                sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "bench_writes", "--json",
+                "--threads", str(options["threads"]), "--operations", str(options["operations"]),
+                "--listings", str(options["listings"]), "--seed", str(options["seed"]),
+            ]
+            output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+            rows.append((mode, json.loads(output.strip().splitlines()[-1])))
+        self.report(rows)
+
+    def report(self, rows):
+        self.stdout.write(f"{'mode':<18}{'writes/s':>10}{'errors':>8}" + "".join(
+            f"{name + ' p50':>13}{name + ' p95':>13}" for name in OPERATIONS
+        ))
+        for mode, results in rows:
+            self.stdout.write(
+                f"{mode:<18}{results['writes'] / results['elapsed']:>10.1f}{results['errors']:>8}" + "".join(
+                    f"{results['operations'][name]['p50']:>10.2f} ms{results['operations'][name]['p95']:>10.2f} ms"
+                    for name in OPERATIONS
+                )
+            )
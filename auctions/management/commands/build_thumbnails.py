@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from auctions import thumbnails
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Renders the missing thumbnails of listing images, for uploads made before the pipeline existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        pending = Listing.objects.exclude(image="").exclude(image=None).filter(thumbnail=None)
+        done = 0
+        lastId = 0
+        while True:
+            ids = list(pending.filter(pk__gt=lastId).order_by("pk").values_list("pk", flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            # Render the batch on the worker pool and wait for it
+            for future in [thumbnails.submit(pk) for pk in ids]:
+                done += future.result()
+            lastId = ids[-1]
+        self.stdout.write(f"Created thumbnails for {done} listings")
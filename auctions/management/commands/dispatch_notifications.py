@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.notifications import EVENT_BATCH_SIZE, RECIPIENT_CHUNK_SIZE, dispatch_pending
+
+
+class Command(BaseCommand):
+    help = "Delivers the pending outbid, closed and comment notifications, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=EVENT_BATCH_SIZE, help="events delivered per transaction")
+        parser.add_argument("--chunk-size", type=int, default=RECIPIENT_CHUNK_SIZE, help="watchers read per query")
+        parser.add_argument("--loop", action="store_true", help="keep running and check again every --interval seconds")
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            dispatched = dispatch_pending(batch_size=options["batch_size"], chunk_size=options["chunk_size"])
+            if dispatched or not options["loop"]:
+                self.stdout.write(f"Delivered {dispatched} events")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.expiry import BATCH_SIZE, close_due_auctions
+
+
+class Command(BaseCommand):
+    help = "Closes the auctions whose end time has passed, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="listings closed per transaction")
+        parser.add_argument("--loop", action="store_true", help="keep running and check again every --interval seconds")
+        parser.add_argument("--interval", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        while True:
+            closed = close_due_auctions(batch_size=options["batch_size"])
+            if closed or not options["loop"]:
+                self.stdout.write(f"Closed {closed} auctions")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
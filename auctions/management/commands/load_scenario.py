@@ -0,0 +1,176 @@
+import random
+import re
+import statistics
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, build_opener
+
+from django.core.management.base import BaseCommand, CommandError
+
+STEPS = ("index", "listing", "bid", "comment")
+
+LISTING_LINK = re.compile(r'href="/listing/(\d+)"')
+LIVE_PRICE = re.compile(r'id="livePrice">([\d.]+)<')
+CSRF_COOKIE = "csrftoken"
+SESSION_COOKIE = "sessionid"
+
+# A response body and the URL it was served from, after redirects
+Page = namedtuple("Page", ["url", "body"])
+
+
+class LoginFailed(Exception):
+    pass
+
+
+def percentile(samples, fraction):
+    """
+    Returns the sample below which `fraction` of the samples fall.
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class VirtualUser:
+    """
+    A browser session of one seeded user: a cookie jar plus the CSRF
+    token Django hands out, so forms can be posted like a real browser.
+    Raises LoginFailed if the server does not log the user in, rather than
+    running the scenario anonymously.
+    """
+
+    def __init__(self, baseUrl, username, password):
+        self.baseUrl = baseUrl.rstrip("/")
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+        self.get("/login")
+        page = self.post("/login", {"username": username, "password": password})
+        # A successful login sets the session cookie and redirects away
+        if self.cookie(SESSION_COOKIE) is None or isLogin(page):
+            raise LoginFailed(f"Cannot log in as {username}")
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+    def get(self, path):
+        with self.opener.open(self.baseUrl + path) as response:
+            return Page(response.geturl(), response.read().decode())
+
+    def post(self, path, data):
+        data = dict(data, csrfmiddlewaretoken=self.cookie(CSRF_COOKIE) or "")
+        request = self.baseUrl + path
+        with self.opener.open(request, urlencode(data).encode()) as response:
+            return Page(response.geturl(), response.read().decode())
+
+
+def isLogin(page):
+    # Pages that need a logged-in user redirect to the login page
+    return urlsplit(page.url).path.rstrip("/") == "/login"
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the browse index -> open listing -> bid -> comment scenario with concurrent "
+        "virtual users against a running server and reports throughput and p50/p95/p99 "
+        "latency per step. Log in as users created by seed_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+        parser.add_argument("--iterations", type=int, default=20, help="scenarios run by every virtual user")
+        parser.add_argument("--prefix", default="seed", help="username prefix used by seed_data")
+        parser.add_argument("--seeded-users", type=int, default=1000, help="number of users created by seed_data")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.timings = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.lock = threading.Lock()
+        rng = random.Random(options["seed"])
+        usernames = [
+            f"{options['prefix']}{i}"
+            for i in rng.sample(range(options["seeded_users"]), min(options["users"], options["seeded_users"]))
+        ]
+
+        try:
+            clients = [VirtualUser(options["base_url"], name, options["password"]) for name in usernames]
+        except LoginFailed as e:
+            raise CommandError(f"{e}; create the users with seed_data first")
+        except OSError as e:
+            raise CommandError(f"Cannot reach {options['base_url']}: {e}")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            futures = [
+                pool.submit(self.run, client, options["iterations"], random.Random(rng.random()))
+                for client in clients
+            ]
+        elapsed = time.perf_counter() - start
+        # A virtual user that crashed would otherwise just leave its
+        # requests out of the report
+        failures = [future.exception() for future in futures if future.exception() is not None]
+        self.report(elapsed)
+        if failures:
+            raise CommandError(f"{len(failures)} of {len(clients)} virtual users failed: {failures[0]!r}")
+
+    def run(self, client, iterations, rng):
+        for _ in range(iterations):
+            page = self.step("index", client.get, "/")
+            ids = LISTING_LINK.findall(page.body if page else "")
+            if not ids:
+                continue
+            listingId = rng.choice(ids)
+
+            page = self.step("listing", client.get, f"/listing/{listingId}")
+            price = LIVE_PRICE.search(page.body if page else "")
+            amount = float(price.group(1)) + rng.randint(1, 20) if price else rng.randint(1, 1000)
+            # The bid form answers 200 either way, with its outcome in the page
+            self.step("bid", client.post, f"/addBid/{listingId}", {"newBid": amount},
+                      ok=lambda page: "Bid Successful" in page.body)
+            self.step("comment", client.post, f"/addComment/{listingId}", {"newComment": "Load test comment"},
+                      ok=lambda page: urlsplit(page.url).path == f"/listing/{listingId}")
+
+    def step(self, name, call, *args, ok=None):
+        """
+        Times one request. Failed requests, and responses that are not what
+        a successful request returns, are counted as errors instead of
+        stopping the run; they are left out of the latencies.
+        """
+        start = time.perf_counter()
+        try:
+            page = call(*args)
+        except (HTTPError, OSError):
+            page = None
+        if page is None or isLogin(page) or (ok is not None and not ok(page)):
+            with self.lock:
+                self.errors[name] += 1
+            return None
+        with self.lock:
+            self.timings[name].append((time.perf_counter() - start) * 1000)
+        return page
+
+    def report(self, elapsed):
+        total = sum(len(samples) for samples in self.timings.values())
+        errors = sum(self.errors.values())
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), {errors} errors")
+        self.stdout.write(f"{'step':<10}{'requests':>10}{'errors':>8}{'req/s':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name in STEPS:
+            samples = self.timings[name]
+            if not samples:
+                self.stdout.write(f"{name:<10}{0:>10}{self.errors[name]:>8}")
+                continue
+            self.stdout.write(
+                f"{name:<10}{len(samples):>10}{self.errors[name]:>8}{len(samples) / elapsed:>8.1f}"
+                f"{statistics.mean(samples):>9.1f}{percentile(samples, 0.50):>9.1f}"
+                f"{percentile(samples, 0.95):>9.1f}{percentile(samples, 0.99):>9.1f}"
+            )
+        self.stdout.write("Latencies in milliseconds")
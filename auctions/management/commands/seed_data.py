@@ -0,0 +1,136 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from auctions import categories as summaries, rankings, watchlist
+from auctions.models import Bid, Category, Comment, Listing, User
+
+WORDS = (
+    "vintage antique modern rare classic handmade wooden leather silver golden "
+    "guitar camera watch lamp chair table bicycle record poster book jacket "
+    "painting vase clock radio mirror rug desk sofa helmet sneakers"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with synthetic users, categories, listings with bid histories, "
+        "comments and watchlists, using bulk inserts. Seeded users log in with --password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--listings", type=int, default=100_000)
+        parser.add_argument("--bids", type=int, default=5, help="average bids per listing")
+        parser.add_argument("--comments", type=int, default=3, help="average comments per listing")
+        parser.add_argument("--watchers", type=int, default=5, help="average watchers per listing")
+        parser.add_argument("--closed", type=float, default=0.2, help="fraction of closed listings")
+        parser.add_argument("--batch-size", type=int, default=2000, help="listings inserted per transaction")
+        parser.add_argument("--prefix", default="seed", help="prefix of the seeded usernames and categories")
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=None, help="random seed, for repeatable data")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        start = time.perf_counter()
+        users = self.createUsers(options)
+        categories = self.createCategories(options)
+        self.stdout.write(f"Created {len(users)} users and {len(categories)} categories")
+
+        totals = {"listings": 0, "bids": 0, "comments": 0, "watchers": 0}
+        for offset in range(0, options["listings"], options["batch_size"]):
+            count = min(options["batch_size"], options["listings"] - offset)
+            with transaction.atomic():
+                for name, created in self.createBatch(count, users, categories, options).items():
+                    totals[name] += created
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{totals['listings']} listings, {totals['bids']} bids ({elapsed:.0f}s)")
+
+        # bulk_create skips the signals that keep the category summaries,
+        # the watcher counts kept by auctions.watchlist and the hot scores
+        # kept by place_bid
+        with transaction.atomic():
+            summaries.rebuild()
+            watchlist.recount()
+            rankings.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {totals['listings']} listings, {totals['bids']} bids, {totals['comments']} comments "
+            f"and {totals['watchers']} watchlist entries in {time.perf_counter() - start:.1f}s"
+        ))
+
+    def createUsers(self, options):
+        # Hashing is slow on purpose, so every seeded user shares one hash
+        password = make_password(options["password"])
+        return User.objects.bulk_create(
+            [User(username=f"{options['prefix']}{i}", password=password) for i in range(options["users"])],
+            batch_size=options["batch_size"],
+        )
+
+    def createCategories(self, options):
+        return [
+            Category.objects.get_or_create(categoryName=f"{options['prefix'].title()} {i}")[0]
+            for i in range(options["categories"])
+        ]
+
+    def createBatch(self, count, users, categories, options):
+        rng = self.rng
+        now = timezone.now()
+
+        # Bid histories: an opening bid by the owner, then rising bids by
+        # others; they are drawn first so the price columns can be filled in
+        histories = []
+        for _ in range(count):
+            owner = rng.choice(users)
+            amount = float(rng.randint(1, 100))
+            history = [(owner, amount)]
+            for _ in range(rng.randint(0, options["bids"] * 2)):
+                amount += rng.randint(1, 20)
+                history.append((rng.choice(users), amount))
+            histories.append(history)
+
+        listings = Listing.objects.bulk_create([
+            Listing(
+                title=" ".join(rng.choices(WORDS, k=3)).capitalize(),
+                description=" ".join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                owner=history[0][0],
+                category=rng.choice(categories),
+                isActive=rng.random() >= options["closed"],
+                ends_at=now + timedelta(days=rng.randint(1, 30)) if rng.random() < 0.5 else None,
+                current_price=history[-1][1],
+                bid_count=len(history) - 1,
+                high_bidder=history[-1][0] if len(history) > 1 else None,
+            )
+            for history in histories
+        ])
+        bids = Bid.objects.bulk_create([
+            Bid(listing=listing, user=user, bid=amount, created_at=now + timedelta(seconds=i))
+            for listing, history in zip(listings, histories)
+            for i, (user, amount) in enumerate(history)
+        ])
+        # Point every listing at its highest bid in one statement
+        Listing.objects.filter(pk__in=[listing.pk for listing in listings]).update(price=Subquery(
+            Bid.objects.filter(listing=OuterRef("pk")).order_by("-bid").values("pk")[:1]
+        ))
+
+        comments = Comment.objects.bulk_create([
+            Comment(listing=listing, author=rng.choice(users), message=" ".join(rng.choices(WORDS, k=8)))
+            for listing in listings
+            for _ in range(rng.randint(0, options["comments"] * 2))
+        ])
+
+        Watchlist = Listing.watchlist.through
+        watchers = Watchlist.objects.bulk_create([
+            Watchlist(listing_id=listing.pk, user_id=user.pk)
+            for listing in listings
+            for user in rng.sample(users, min(len(users), rng.randint(0, options["watchers"] * 2)))
+        ])
+
+        return {"listings": len(listings), "bids": len(bids), "comments": len(comments), "watchers": len(watchers)}
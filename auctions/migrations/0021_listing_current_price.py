@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_current_price(apps, schema_editor):
+    """
+    Copies the price of every listing out of its Listing.price bid.
+    The opening bid is created by the owner, so a price bid placed by
+    anyone else means the listing has received a bid.
+    """
+    Listing = apps.get_model('auctions', 'Listing')
+    batch = []
+    for listing in Listing.objects.select_related('price').exclude(price=None).iterator(chunk_size=1000):
+        listing.current_price = listing.price.bid
+        if listing.price.user_id is not None and listing.price.user_id != listing.owner_id:
+            listing.high_bidder_id = listing.price.user_id
+            listing.bid_count = 1
+        batch.append(listing)
+        if len(batch) == 1000:
+            Listing.objects.bulk_update(batch, ['current_price', 'high_bidder', 'bid_count'])
+            batch = []
+    Listing.objects.bulk_update(batch, ['current_price', 'high_bidder', 'bid_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0020_alter_listing_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='high_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leadingListings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_current_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def link_price_bids(apps, schema_editor):
+    """
+    Links every bid still referenced by Listing.price to its listing.
+    Older bids were never linked to a listing and cannot be recovered.
+    """
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    batch = []
+    for listing_id, price_id in Listing.objects.exclude(price=None).values_list('id', 'price_id').iterator(chunk_size=1000):
+        batch.append(Bid(pk=price_id, listing_id=listing_id))
+        if len(batch) == 1000:
+            Bid.objects.bulk_update(batch, ['listing'])
+            batch = []
+    Bid.objects.bulk_update(batch, ['listing'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0021_listing_current_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='listing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid', 'created_at', 'user'], name='bid_listing_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['user', '-created_at'], name='bid_user_recent_idx'),
+        ),
+        migrations.RunPython(link_price_bids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:35
+
+from django.db import migrations
+
+from auctions import search
+
+
+def install_search_index(apps, schema_editor):
+    search.install(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0022_bid_listing'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
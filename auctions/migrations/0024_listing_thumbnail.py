@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0023_listing_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail_webp',
+            field=models.ImageField(blank=True, null=True, upload_to='thumbnails/'),
+        ),
+    ]
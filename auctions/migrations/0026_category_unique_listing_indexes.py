@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:52
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_categories(apps, schema_editor):
+    """
+    Keeps the oldest category of every duplicated name and moves the
+    listings of the other copies to it, so the unique constraint can be
+    added.
+    """
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    duplicates = (
+        Category.objects.values('categoryName')
+        .annotate(copies=Count('pk'), keep=Min('pk'))
+        .filter(copies__gt=1)
+    )
+    for duplicate in duplicates:
+        copies = Category.objects.filter(categoryName=duplicate['categoryName']).exclude(pk=duplicate['keep'])
+        Listing.objects.filter(category__in=copies).update(category_id=duplicate['keep'])
+        copies.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0025_listing_ends_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_active_ends_idx',
+        ),
+        migrations.RunPython(merge_duplicate_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='categoryName',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['ends_at'], name='listing_active_ends_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['id'], name='listing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['category', 'id'], name='listing_active_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', False)), fields=['id'], name='listing_closed_idx'),
+        ),
+        # The watchlist table is created by the ManyToManyField, so its index
+        # is added in SQL: a user's watched listing ids are read from it alone
+        migrations.RunSQL(
+            'CREATE INDEX auctions_watchlist_user_listing_idx ON auctions_listing_watchlist (user_id, listing_id)',
+            'DROP INDEX auctions_watchlist_user_listing_idx',
+        ),
+    ]
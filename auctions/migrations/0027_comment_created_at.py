@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0026_category_unique_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', '-created_at', '-id'], name='comment_listing_created_idx'),
+        ),
+    ]
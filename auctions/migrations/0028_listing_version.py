@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0027_comment_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
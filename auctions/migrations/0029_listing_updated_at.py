@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0028_listing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['updated_at'], name='listing_updated_idx'),
+        ),
+    ]
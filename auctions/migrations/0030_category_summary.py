@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:14
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def count_active_listings(apps, schema_editor):
+    """
+    Fills in the summaries of the existing categories; from here on they
+    are kept up to date by every write.
+    """
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    summaries = (
+        Listing.objects.filter(isActive=True, category__isnull=False)
+        .values('category')
+        .annotate(count=Count('pk'), lowest=Min('current_price'), highest=Max('current_price'))
+    )
+    for summary in summaries:
+        Category.objects.filter(pk=summary['category']).update(
+            active_count=summary['count'], min_price=summary['lowest'], max_price=summary['highest']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0029_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='max_price',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='min_price',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['category', 'current_price'], name='listing_active_price_idx'),
+        ),
+        migrations.RunPython(count_active_listings, migrations.RunPython.noop),
+    ]
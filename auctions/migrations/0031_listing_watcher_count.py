@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:26
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_watchers(apps, schema_editor):
+    """
+    Fills in the watcher count of every watched listing.
+    """
+    Listing = apps.get_model('auctions', 'Listing')
+    Watchlist = Listing.watchlist.through
+    counts = Watchlist.objects.values('listing_id').annotate(count=Count('pk'))
+    for row in counts:
+        Listing.objects.filter(pk=row['listing_id']).update(watcher_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0030_category_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='watcher_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_watchers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['-watcher_count', 'id'], name='listing_active_watched_idx'),
+        ),
+    ]
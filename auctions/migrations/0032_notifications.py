@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0031_listing_watcher_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('outbid', 'Outbid'), ('closed', 'Closed'), ('comment', 'Comment')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('read', models.BooleanField(default=False)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='auctions.listing')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='notification_user_created_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('read', False)), fields=('user', 'listing', 'kind'), name='notification_unread_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('outbid', 'Outbid'), ('closed', 'Closed'), ('comment', 'Comment')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('bid', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificationEvents', to='auctions.listing')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dispatched_at', None)), fields=['id'], name='event_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:35
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+from django.db.models import F
+
+# As in auctions.rankings, frozen at the time of this migration
+DECAY_RATE = math.log(2) / (6 * 60 * 60)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def score_bids(apps, schema_editor):
+    """
+    Fills in the hot score of every listing from the bids placed on it.
+    """
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    scores = {}
+    bids = Bid.objects.filter(listing__isnull=False).exclude(user=F('listing__owner'))
+    for listingId, createdAt in bids.values_list('listing_id', 'created_at').iterator():
+        weight = DECAY_RATE * (createdAt - EPOCH).total_seconds()
+        score = scores.get(listingId)
+        if score is None:
+            scores[listingId] = weight
+        else:
+            high, low = max(score, weight), min(score, weight)
+            scores[listingId] = high + math.log1p(math.exp(low - high))
+    for listingId, score in scores.items():
+        Listing.objects.filter(pk=listingId).update(hot_score=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0032_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='hot_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(score_bids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['-hot_score', 'id'], name='listing_active_hot_idx'),
+        ),
+    ]
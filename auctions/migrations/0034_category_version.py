@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0033_listing_hot_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0034_category_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='watchlist_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
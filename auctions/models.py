@@ -1,25 +1,41 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 # This class extends Django's built-in AbstractUser model
-# and adds no additional functionality
 class User(AbstractUser):
-    pass
+    # PositiveIntegerField incremented by every change to the user's
+    # watchlist, in the same transaction; the cached set of watched listing
+    # ids and the pages' ETags are versioned by it
+    watchlist_version = models.PositiveIntegerField(default=1)
 
 # This class defines a Category model with a single CharField
 # to store the category name
 class Category(models.Model):
     # CharField to store the name of the category
-    # with a max length of 50 characters
-    categoryName = models.CharField(max_length=50)
+    # with a max length of 50 characters; names are unique, so looking a
+    # category up by name reads a single row from the unique index
+    categoryName = models.CharField(max_length=50, unique=True)
+    # PositiveIntegerField counting the active listings in the category, and
+    # FloatFields with the lowest and highest current price among them
+    # (empty while there are none); kept up to date by auctions.categories
+    active_count = models.PositiveIntegerField(default=0)
+    min_price = models.FloatField(blank=True, null=True)
+    max_price = models.FloatField(blank=True, null=True)
+    # PositiveIntegerField incremented by every change to the row, in the
+    # same transaction; the cached category lists are versioned by it
+    version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         # Returns the category name when the object is printed
         return self.categoryName
 
-# This class defines a Bid model with a single FloatField
-# to store the bid amount
+# This class defines a Bid model, the ledger of every bid placed on a listing:
+# - FloatField to store the bid amount
+# - ForeignKey to the User who placed the bid
+# - ForeignKey to the Listing the bid was placed on
+# - DateTimeField to store when the bid was placed
 class Bid(models.Model):
     # FloatField to store the bid amount
     # with a default value of 0
@@ -27,7 +43,21 @@ class Bid(models.Model):
     # ForeignKey to a User object, with the option to delete the object
     # if the user is deleted
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="Userbid")
-    
+    # ForeignKey to the Listing the bid was placed on
+    # with the option to delete the object if the listing is deleted
+    listing = models.ForeignKey("Listing", on_delete=models.CASCADE, blank=True, null=True, related_name="bids")
+    # DateTimeField to store when the bid was placed
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Highest bids of a listing first; the user column makes the
+            # index covering, so bid history is read from the index alone
+            models.Index(fields=["listing", "-bid", "created_at", "user"], name="bid_listing_amount_idx"),
+            # Most recent bids of a user first
+            models.Index(fields=["user", "-created_at"], name="bid_user_recent_idx"),
+        ]
+
 
 # This class defines a Listing model with several fields:
 # - CharField for the listing title (max length of 100 characters)
@@ -48,12 +78,19 @@ class Listing(models.Model):
     # CharField to store the URL of the listing's image
     # with a max length of 200 characters
     image = models.ImageField(blank=True, null=True, upload_to='images/')
+    # Fixed-size JPEG and WebP thumbnails of the image, shown in the listing
+    # grids; empty until auctions.thumbnails has processed the upload
+    thumbnail = models.ImageField(blank=True, null=True, upload_to='thumbnails/')
+    thumbnail_webp = models.ImageField(blank=True, null=True, upload_to='thumbnails/')
     # ForeignKey to a Bid object to store the price of the listing
     # with the option to delete the object if the bid is deleted
     price = models.ForeignKey(Bid, on_delete=models.CASCADE, blank=True, null=True, related_name="bidPrice")
     # BooleanField to store whether the listing is active or not
     # with a default value of True
     isActive = models.BooleanField(default=True)
+    # DateTimeField to store when the auction ends; listings without an end
+    # time stay open until the owner closes them
+    ends_at = models.DateTimeField(blank=True, null=True)
     # ForeignKey to a User object to store the owner of the listing
     # with the option to delete the object if the user is deleted
     owner = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="user")
@@ -62,15 +99,81 @@ class Listing(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, blank=True, null=True, related_name="category")
     # ManyToManyField to a User object to store the users who have added the listing to their watchlist
     watchlist = models.ManyToManyField(User, blank=True, related_name="listingWatchlist")
+    # FloatField mirroring price.bid, so the current price can be read and
+    # compared without joining the Bid table
+    current_price = models.FloatField(default=0)
+    # PositiveIntegerField counting the bids accepted on the listing
+    bid_count = models.PositiveIntegerField(default=0)
+    # ForeignKey to the User holding the highest bid, empty until the first bid
+    high_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name="leadingListings")
+    # PositiveIntegerField counting the users watching the listing, kept by
+    # auctions.watchlist.watch() and unwatch()
+    watcher_count = models.PositiveIntegerField(default=0)
+    # FloatField measuring the recent bid activity on the listing, raised by
+    # every bid and empty until the first one; see auctions.rankings
+    hot_score = models.FloatField(blank=True, null=True)
+    # PositiveIntegerField incremented whenever the price, bid count,
+    # watcher count, thumbnail or state of the listing changes; the API
+    # derives its ETags from it
+    version = models.PositiveIntegerField(default=1)
+    # DateTimeField set whenever the listing page changes: on save, and by
+    # bids, comments, closing and new thumbnails; pages are revalidated
+    # against it
+    updated_at = models.DateTimeField(auto_now=True)
      
+    class Meta:
+        indexes = [
+            # Django filters on a boolean column with a bare "isActive" (or
+            # NOT "isActive") predicate, which a partial index with the same
+            # condition matches while an index starting with isActive does not
+
+            # Open listings by end time, scanned by the expiry worker
+            models.Index(fields=["ends_at"], condition=models.Q(isActive=True), name="listing_active_ends_idx"),
+            # Active listings in id order, read page by page by the index feed
+            models.Index(fields=["id"], condition=models.Q(isActive=True), name="listing_active_idx"),
+            # Active listings of a category in id order, for the category feed
+            models.Index(fields=["category", "id"], condition=models.Q(isActive=True), name="listing_active_category_idx"),
+            # Active listings of a category by price, for the lowest and
+            # highest price of the category summaries
+            models.Index(fields=["category", "current_price"], condition=models.Q(isActive=True), name="listing_active_price_idx"),
+            # Active listings by number of watchers, most watched first
+            models.Index(fields=["-watcher_count", "id"], condition=models.Q(isActive=True), name="listing_active_watched_idx"),
+            # Active listings by bid activity, hottest first
+            models.Index(fields=["-hot_score", "id"], condition=models.Q(isActive=True), name="listing_active_hot_idx"),
+            # Closed listings, for the closed listings page
+            models.Index(fields=["id"], condition=models.Q(isActive=False), name="listing_closed_idx"),
+            # Most recently changed listing, the version of the listing feeds
+            models.Index(fields=["updated_at"], name="listing_updated_idx"),
+        ]
+
+    @property
+    def is_open(self):
+        """
+        Checks if the listing still takes bids: it is active and its end
+        time, if any, has not passed yet. The expiry worker only closes
+        ended listings periodically, so isActive alone can lag behind.
+        """
+        return self.isActive and (self.ends_at is None or self.ends_at > timezone.now())
+
+    def is_watched_by(self, user):
+        """
+        Checks if a user has the listing in their watchlist.
+        Runs an EXISTS query on the (listing, user) unique index of the
+        watchlist table instead of loading every watcher.
+        """
+        if not user.is_authenticated:
+            return False
+        return Listing.watchlist.through.objects.filter(listing_id=self.pk, user_id=user.pk).exists()
+
     def __str__(self):
         # Returns the title of the listing when the object is printed
         return self.title
 
-# This class defines a Comment model with three fields:
+# This class defines a Comment model with four fields:
 # - ForeignKey to a User object to store the author of the comment
 # - ForeignKey to a Listing object to store the listing that the comment is for
 # - CharField to store the message of the comment (max length of 500 characters)
+# - DateTimeField to store when the comment was posted
 class Comment(models.Model):
     # ForeignKey to a User object to store the author of the comment
     # with the option to delete the object if the user is deleted
@@ -81,6 +184,15 @@ class Comment(models.Model):
     # CharField to store the message of the comment
     # with a max length of 500 characters
     message = models.CharField(max_length=500)
+    # DateTimeField to store when the comment was posted
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Comments of a listing newest first, read page by page; the id
+            # breaks ties between comments posted in the same instant
+            models.Index(fields=["listing", "-created_at", "-id"], name="comment_listing_created_idx"),
+        ]
 
     def __str__(self):
         # Returns a string representation of the comment in the form:
@@ -88,4 +200,66 @@ class Comment(models.Model):
         f"{self.author} commented on {self.listing}"
 
 
+# This class defines a NotificationEvent model, the outbox of changes that
+# users are told about. A row is written in the same transaction as the
+# bid, close or comment it describes, and auctions.notifications delivers
+# it to the watchers of the listing afterwards:
+# - CharField with the kind of event
+# - ForeignKey to the Listing the event happened on
+# - ForeignKey to the User who caused it, who is not notified
+# - ForeignKey to the Bid of an outbid event
+# - DateTimeFields with when the event happened and was delivered
+class NotificationEvent(models.Model):
+    OUTBID = "outbid"
+    CLOSED = "closed"
+    COMMENT = "comment"
+    KINDS = [(OUTBID, "Outbid"), (CLOSED, "Closed"), (COMMENT, "Comment")]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="notificationEvents")
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    bid = models.ForeignKey(Bid, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+    # Empty until the dispatcher has delivered the event
+    dispatched_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Undelivered events in the order they happened, read batch by
+            # batch by the dispatcher
+            models.Index(fields=["id"], condition=models.Q(dispatched_at=None), name="event_pending_idx"),
+        ]
+
 
+# This class defines a Notification model, a message in a user's in-app
+# inbox. Events of the same kind on the same listing are coalesced into one
+# unread notification, whose count says how many there were:
+# - ForeignKey to the User the notification is for
+# - ForeignKey to the Listing it is about
+# - CharField with the kind of event, as in NotificationEvent
+# - PositiveIntegerField counting the coalesced events
+# - DateTimeField with when the latest of them was delivered
+# - BooleanField set once the user has read it
+class Notification(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=10, choices=NotificationEvent.KINDS)
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+    read = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # At most one unread notification per user, listing and kind,
+            # which new events of the same kind are added to
+            models.UniqueConstraint(
+                fields=["user", "listing", "kind"], condition=models.Q(read=False), name="notification_unread_unique"
+            ),
+        ]
+        indexes = [
+            # A user's notifications newest first, for the inbox page
+            models.Index(fields=["user", "-created_at"], name="notification_user_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} on {self.listing} for {self.user}"
@@ -0,0 +1,270 @@
+"""
+Notifications of outbids, closed auctions and new comments.
+
+The writes that users are told about record a NotificationEvent in the
+same transaction as the change itself (place_bid, close_auction,
+expiry.close_batch and new comments), so an event exists exactly when its
+change was committed. This outbox is delivered later, by
+dispatch_pending(), run by the dispatch_notifications command:
+
+- pending events are read a batch at a time from the partial
+  event_pending_idx index;
+- the watchers of the batch's listings are read in chunks of users, so a
+  listing watched by many users is never loaded at once. The bidder an
+  outbid event took the lead from is notified even without watching;
+- every user's events are coalesced into one notice per listing and kind,
+  with a count, and the notices of a chunk are handed to every sink;
+- the events are marked as delivered in the same transaction as the inbox
+  writes, so a batch that fails is delivered again by the next run.
+
+The sinks are pluggable through the AUCTIONS_NOTIFICATION_SINKS setting:
+
+- InboxSink adds the notices to the users' in-app inboxes, adding them to
+  an unread notification of the same listing and kind if there is one;
+- EmailSink sends each user of a chunk one email with all of their
+  notices, through Django's EMAIL_BACKEND (the console by default).
+"""
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Bid, Notification, NotificationEvent, User
+from .watchlist import Watchlist
+
+# Number of events delivered per transaction
+EVENT_BATCH_SIZE = 100
+
+# Number of users whose watchlists are read per query
+RECIPIENT_CHUNK_SIZE = 500
+
+# The events of one kind on one listing, coalesced for one user
+Notice = namedtuple("Notice", ["user_id", "listing_id", "title", "kind", "count"])
+
+
+def record(kind, listing_id, actor=None, bid=None):
+    """
+    Adds an event to the outbox. Must be called in the transaction that
+    makes the change the event describes.
+    Parameters:
+        kind: NotificationEvent.OUTBID, CLOSED or COMMENT
+        listing_id: primary key of the listing
+        actor: the user who caused the event, who is not notified of it
+        bid: the accepted Bid of an outbid event
+    """
+    NotificationEvent.objects.create(
+        kind=kind, listing_id=listing_id, actor_id=getattr(actor, "pk", None), bid=bid
+    )
+
+
+def record_closed(listing_ids, actor=None):
+    """
+    Adds a closed event for each of the listings to the outbox, in one query.
+    """
+    NotificationEvent.objects.bulk_create([
+        NotificationEvent(kind=NotificationEvent.CLOSED, listing_id=listing_id, actor_id=getattr(actor, "pk", None))
+        for listing_id in listing_ids
+    ])
+
+
+def describe(notice):
+    """
+    Returns a sentence describing a notice.
+    """
+    if notice.kind == NotificationEvent.OUTBID:
+        bids = "A higher bid was" if notice.count == 1 else f"{notice.count} higher bids were"
+        return f"{bids} placed on {notice.title}"
+    if notice.kind == NotificationEvent.CLOSED:
+        return f"The auction for {notice.title} has closed"
+    comments = "A new comment was" if notice.count == 1 else f"{notice.count} new comments were"
+    return f"{comments} posted on {notice.title}"
+
+
+class InboxSink:
+    """
+    Adds notices to the users' in-app inboxes.
+    """
+
+    def deliver(self, notices):
+        if not notices:
+            return
+        now = timezone.now()
+        # The unread notifications the notices are added to, in one query
+        # on the notification_unread_unique index
+        unread = {
+            (row["user_id"], row["listing_id"], row["kind"]): row["pk"]
+            for row in Notification.objects.filter(
+                read=False,
+                user_id__in={notice.user_id for notice in notices},
+                listing_id__in={notice.listing_id for notice in notices},
+            ).values("pk", "user_id", "listing_id", "kind")
+        }
+        # One UPDATE per distinct number of events added
+        byCount = defaultdict(list)
+        created = []
+        for notice in notices:
+            pk = unread.get((notice.user_id, notice.listing_id, notice.kind))
+            if pk is None:
+                created.append(Notification(
+                    user_id=notice.user_id, listing_id=notice.listing_id, kind=notice.kind,
+                    count=notice.count, created_at=now,
+                ))
+            else:
+                byCount[notice.count].append(pk)
+        for count, ids in byCount.items():
+            Notification.objects.filter(pk__in=ids).update(count=F("count") + count, created_at=now)
+        Notification.objects.bulk_create(created)
+
+
+class EmailSink:
+    """
+    Sends every user one email with all of their notices, over a single
+    connection to the configured email backend. Users without an email
+    address are skipped.
+    """
+
+    def deliver(self, notices):
+        byUser = defaultdict(list)
+        for notice in notices:
+            byUser[notice.user_id].append(notice)
+        addresses = dict(
+            User.objects.filter(pk__in=byUser).exclude(email="").values_list("pk", "email")
+        )
+        messages = []
+        for user_id, address in addresses.items():
+            userNotices = byUser[user_id]
+            subject = "1 update" if len(userNotices) == 1 else f"{len(userNotices)} updates"
+            messages.append(EmailMessage(
+                subject=f"Auctions: {subject} on listings you follow",
+                body="\n".join(f"- {describe(notice)}" for notice in userNotices),
+                to=[address],
+            ))
+        if messages:
+            get_connection().send_messages(messages)
+
+
+_sinks = None
+_sinksLock = threading.Lock()
+
+
+def get_sinks():
+    """
+    Returns the sinks configured in AUCTIONS_NOTIFICATION_SINKS, created on
+    first use.
+    """
+    global _sinks
+    with _sinksLock:
+        if _sinks is None:
+            paths = getattr(settings, "AUCTIONS_NOTIFICATION_SINKS", ["auctions.notifications.InboxSink"])
+            _sinks = [import_string(path)() for path in paths]
+        return _sinks
+
+
+def pending_events():
+    """
+    Returns the undelivered events, oldest first.
+    """
+    return NotificationEvent.objects.filter(dispatched_at=None).order_by("pk")
+
+
+def dispatch_pending(batch_size=EVENT_BATCH_SIZE, chunk_size=RECIPIENT_CHUNK_SIZE, sinks=None):
+    """
+    Delivers every pending event to the users it concerns.
+    Parameters:
+        batch_size: the number of events delivered per transaction
+        chunk_size: the number of users whose watchlists are read per query
+        sinks: the sinks to deliver to, defaults to get_sinks()
+    Returns:
+        The number of events delivered
+    """
+    sinks = get_sinks() if sinks is None else sinks
+    dispatched = 0
+    while True:
+        delivered = dispatch_batch(batch_size, chunk_size, sinks)
+        if not delivered:
+            return dispatched
+        dispatched += delivered
+
+
+def dispatch_batch(batch_size, chunk_size, sinks):
+    """
+    Delivers the oldest batch of pending events in one transaction.
+    Returns the number of events delivered.
+    """
+    with transaction.atomic():
+        events = pending_events()
+        if transaction.get_connection().features.has_select_for_update_skip_locked:
+            # Dispatchers running side by side take different batches; SQLite
+            # already serializes them when the transaction begins
+            events = events.select_for_update(skip_locked=True, of=("self",))
+        # The bidder each outbid event took the lead from, read from the
+        # bid_listing_amount_idx index
+        previous = Bid.objects.filter(
+            listing_id=OuterRef("listing_id"), bid__lt=OuterRef("bid__bid")
+        ).order_by("-bid", "created_at").values("user_id")[:1]
+        events = list(events.values(
+            "pk", "kind", "listing_id", "actor_id", title=F("listing__title"),
+            owner_id=F("listing__owner_id"), previous_id=Subquery(previous),
+        )[:batch_size])
+        if not events:
+            return 0
+
+        byListing = defaultdict(list)
+        outbid = defaultdict(list)
+        for event in events:
+            byListing[event["listing_id"]].append(event)
+            # The owner's opening price is not a bid that can be outbid
+            if event["previous_id"] is not None and event["previous_id"] != event["owner_id"]:
+                outbid[event["previous_id"]].append(event)
+
+        for notices in coalesced(byListing, outbid, chunk_size):
+            for sink in sinks:
+                sink.deliver(notices)
+
+        NotificationEvent.objects.filter(pk__in=[event["pk"] for event in events]).update(dispatched_at=timezone.now())
+    return len(events)
+
+
+def coalesced(byListing, outbid, chunk_size):
+    """
+    Yields, one chunk of users at a time, the notices of every user who
+    watches one of the listings or was outbid, coalesced per listing and kind.
+    Users are read in id order, so each user is in exactly one chunk.
+    """
+    watchers = Watchlist.objects.filter(listing_id__in=byListing)
+    outbidIds = sorted(outbid)
+    last = 0
+    while True:
+        userIds = list(
+            watchers.filter(user_id__gt=last).order_by("user_id").values_list("user_id", flat=True).distinct()[:chunk_size]
+        )
+        # Once the watchers run out, the chunk takes every remaining outbid user
+        upper = userIds[-1] if len(userIds) == chunk_size else None
+
+        events = defaultdict(dict)
+        for user_id, listing_id in watchers.filter(user_id__in=userIds).values_list("user_id", "listing_id"):
+            for event in byListing[listing_id]:
+                events[user_id][event["pk"]] = event
+        # Keyed by event, so a watcher who was also outbid counts it once
+        for user_id in outbidIds:
+            if user_id > last and (upper is None or user_id <= upper):
+                for event in outbid[user_id]:
+                    events[user_id][event["pk"]] = event
+
+        notices = []
+        for user_id, userEvents in sorted(events.items()):
+            counts = Counter(
+                (event["listing_id"], event["title"], event["kind"])
+                for event in userEvents.values() if event["actor_id"] != user_id
+            )
+            notices.extend(Notice(user_id, listing_id, title, kind, count) for (listing_id, title, kind), count in counts.items())
+        yield notices
+
+        if upper is None:
+            return
+        last = upper
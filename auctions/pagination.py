@@ -0,0 +1,138 @@
+"""
+Keyset (cursor based) pagination for the listing feeds and comment threads.
+
+Instead of OFFSET/LIMIT, every page is fetched with a ``WHERE id > cursor``
+filter on the primary key index, so the cost of a page does not grow with
+how deep the user has scrolled. Comments are paged newest first on
+(created_at, id) in the same way.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+# Timestamps in cursors are counted in microseconds from the epoch
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Number of rows shown on every page of a feed
+PAGE_SIZE = 24
+
+
+class Page:
+    """
+    A single page of results.
+    Attributes:
+        items: the rows on this page
+        next_cursor: the cursor to pass to fetch the next page, or None on the last page
+    """
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def parse_cursor(value):
+    """
+    Converts a cursor taken from the query string into an id.
+    Missing or malformed cursors start the feed from the beginning.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, size=PAGE_SIZE):
+    """
+    Returns one page of `queryset` ordered by primary key.
+    Parameters:
+        queryset: the rows to paginate; any select_related() joins are kept,
+                  and a values() queryset must include "pk"
+        cursor: the id of the last row on the previous page
+        size: the maximum number of rows on the page
+    Returns:
+        A Page holding at most `size` rows
+    """
+    return keyset_result(list(keyset_query(queryset, cursor, size)), size)
+
+
+async def akeyset_page(queryset, cursor=None, size=PAGE_SIZE):
+    """
+    keyset_page() for async views, read with the async ORM.
+    """
+    return keyset_result([row async for row in keyset_query(queryset, cursor, size)], size)
+
+
+def keyset_query(queryset, cursor, size):
+    cursor = parse_cursor(cursor)
+    if cursor is not None:
+        queryset = queryset.filter(pk__gt=cursor)
+
+    # Fetch one extra row so we know whether there is a next page
+    # without running a separate COUNT query
+    return queryset.order_by("pk")[:size + 1]
+
+
+def keyset_result(rows, size):
+    if len(rows) > size:
+        last = rows[size - 1]
+        return Page(rows[:size], last["pk"] if isinstance(last, dict) else last.pk)
+    return Page(rows, None)
+
+
+def format_timeline_cursor(row):
+    """
+    Returns the cursor pointing after `row`, a row with created_at and pk.
+    """
+    return f"{(row.created_at - EPOCH) // timedelta(microseconds=1)}.{row.pk}"
+
+
+def parse_timeline_cursor(value):
+    """
+    Converts a cursor taken from the query string into (created_at, id).
+    Missing or malformed cursors start from the newest row.
+    """
+    try:
+        micros, pk = str(value).split(".")
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def timeline_page(queryset, cursor=None, size=PAGE_SIZE):
+    """
+    Returns one page of `queryset` ordered newest first by (created_at, pk).
+    Parameters:
+        queryset: the rows to paginate, which must have a created_at field
+        cursor: the cursor returned with the previous page
+        size: the maximum number of rows on the page
+    Returns:
+        A Page holding at most `size` rows
+    """
+    return timeline_result(list(timeline_query(queryset, cursor, size)), size)
+
+
+async def atimeline_page(queryset, cursor=None, size=PAGE_SIZE):
+    """
+    timeline_page() for async views, read with the async ORM.
+    """
+    return timeline_result([row async for row in timeline_query(queryset, cursor, size)], size)
+
+
+def timeline_query(queryset, cursor, size):
+    cursor = parse_timeline_cursor(cursor)
+    if cursor is not None:
+        createdAt, pk = cursor
+        queryset = queryset.filter(Q(created_at__lt=createdAt) | Q(created_at=createdAt, pk__lt=pk))
+    return queryset.order_by("-created_at", "-pk")[:size + 1]
+
+
+def timeline_result(rows, size):
+    if len(rows) > size:
+        return Page(rows[:size], format_timeline_cursor(rows[size - 1]))
+    return Page(rows, None)
@@ -0,0 +1,280 @@
+"""
+Per-view instrumentation: query count, database time, template render
+time and total latency, aggregated by URL name.
+
+ProfilingMiddleware records every request. SQL statements are only kept
+for a sample of requests (AUCTIONS_PROFILING["SAMPLE_RATE"]), so with
+sampling off the cost is a counter and a timer per query. Requests slower
+than AUCTIONS_PROFILING["SLOW_REQUEST_MS"] are kept in a short list of
+slow samples, with their SQL if the request was sampled.
+
+Template time is measured by ProfilingTemplates, a drop-in replacement
+for the DjangoTemplates backend configured in TEMPLATES.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+# Number of slow requests kept for the stats page
+SLOW_SAMPLES = 50
+
+DEFAULTS = {
+    # Requests slower than this are kept as slow samples
+    "SLOW_REQUEST_MS": 500,
+    # Fraction of requests whose SQL statements are recorded
+    "SAMPLE_RATE": 0.0,
+}
+
+# The measurements of the request being served
+_current = ContextVar("auctions_profile", default=None)
+
+
+def config(name):
+    return getattr(settings, "AUCTIONS_PROFILING", {}).get(name, DEFAULTS[name])
+
+
+class Profile:
+    """
+    The measurements of a single request.
+    """
+
+    def __init__(self, sampled):
+        self.queries = 0
+        self.dbTime = 0.0
+        self.templateTime = 0.0
+        self.sql = [] if sampled else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper, see connection.execute_wrapper()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.dbTime += elapsed
+            if self.sql is not None:
+                self.sql.append((sql, round(elapsed * 1000, 3)))
+
+
+class ViewStats:
+    """
+    Totals of the measurements of every request served by one view.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.maxQueries = 0
+        self.dbTime = 0.0
+        self.templateTime = 0.0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+
+    def add(self, profile, totalTime):
+        self.requests += 1
+        self.queries += profile.queries
+        self.maxQueries = max(self.maxQueries, profile.queries)
+        self.dbTime += profile.dbTime
+        self.templateTime += profile.templateTime
+        self.totalTime += totalTime
+        self.maxTime = max(self.maxTime, totalTime)
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "queries_avg": self.queries / requests,
+            "queries_max": self.maxQueries,
+            "db_ms_avg": self.dbTime * 1000 / requests,
+            "template_ms_avg": self.templateTime * 1000 / requests,
+            "total_ms_avg": self.totalTime * 1000 / requests,
+            "total_ms_max": self.maxTime * 1000,
+        }
+
+
+class Registry:
+    """
+    The stats of every view and the latest slow requests of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self._slow = deque(maxlen=SLOW_SAMPLES)
+
+    def record(self, name, path, profile, totalTime):
+        with self._lock:
+            self._views.setdefault(name, ViewStats()).add(profile, totalTime)
+            if totalTime * 1000 >= config("SLOW_REQUEST_MS"):
+                self._slow.append({
+                    "view": name,
+                    "path": path,
+                    "total_ms": totalTime * 1000,
+                    "queries": profile.queries,
+                    "sql": profile.sql,
+                })
+
+    def views(self):
+        """
+        Returns the stats of every view as dicts, by URL name.
+        """
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._views.items())}
+
+    def totals(self):
+        """
+        Returns the raw totals of every view, for the metrics endpoint.
+        """
+        with self._lock:
+            return [(name, vars(stats).copy()) for name, stats in sorted(self._views.items())]
+
+    def slow_requests(self):
+        """
+        Returns the latest slow requests, most recent first.
+        """
+        with self._lock:
+            return list(reversed(self._slow))
+
+
+registry = Registry()
+
+
+def instrument(profile):
+    """
+    Records the queries of this thread's database connections into a
+    profile, until the returned ExitStack is closed.
+    """
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    return stack
+
+
+class ProfilingMiddleware:
+    """
+    Measures every request and records it under its URL name.
+    Should be the first middleware so the total latency covers the others.
+    Works under both WSGI and ASGI, so it does not make async views run in
+    a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = Profile(sampled=random.random() < config("SAMPLE_RATE"))
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with instrument(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, profile, start)
+        return response
+
+    async def __acall__(self, request):
+        profile = Profile(sampled=random.random() < config("SAMPLE_RATE"))
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            # The queries of a request served through ASGI run in its
+            # sync_to_async thread, so that thread's connections are wrapped
+            stack = await sync_to_async(instrument)(profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        self.record(request, profile, start)
+        return response
+
+    def record(self, request, profile, start):
+        totalTime = time.perf_counter() - start
+        match = request.resolver_match
+        name = match.view_name if match else "<unresolved>"
+        registry.record(name, request.path, profile, totalTime)
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing every render into the current
+    request's profile.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.templateTime += time.perf_counter() - start
+
+
+def prometheus_metrics():
+    """
+    Returns the stats of every view, and the fragment cache counters, in
+    the Prometheus text format.
+    """
+    from . import fragments
+
+    totals = registry.totals()
+    metrics = [
+        ("auctions_requests_total", "counter", "Requests served", "requests"),
+        ("auctions_request_queries_total", "counter", "SQL queries run", "queries"),
+        ("auctions_request_db_seconds_total", "counter", "Time spent in SQL queries", "dbTime"),
+        ("auctions_request_template_seconds_total", "counter", "Time spent rendering templates", "templateTime"),
+        ("auctions_request_seconds_total", "counter", "Time spent serving requests", "totalTime"),
+        ("auctions_request_seconds_max", "gauge", "Slowest request", "maxTime"),
+    ]
+    lines = []
+    for metric, kind, description, field in metrics:
+        lines.append(f"# HELP {metric} {description}, by view")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, stats in totals:
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{metric}{{view="{label}"}} {stats[field]}')
+
+    cache = fragments.stats()
+    for result in ("hits", "misses"):
+        metric = f"auctions_fragment_cache_{result}_total"
+        lines.append(f"# HELP {metric} Listing fragment cache {result}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {cache[result]}")
+    return "\n".join(lines) + "\n"
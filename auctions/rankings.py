@@ -0,0 +1,126 @@
+"""
+Rankings of the active listings: the hottest, the most watched and those
+ending soonest, offered as sort orders of the index page.
+
+Every ranking is a column of the listing row, kept up to date by the
+writes that change it, with a partial index over the active listings in
+ranking order, so the top of a ranking is read with a single index scan
+and nothing is counted or sorted per request:
+
+- hot: Listing.hot_score, raised by every accepted bid in the same UPDATE
+  that raises the price (bidding.place_bid);
+- watched: Listing.watcher_count, kept by watchlist.watch() and unwatch();
+- ending: Listing.ends_at, which does not change.
+
+The hot score measures bid velocity as exponentially decaying bid counts:
+every bid is worth 1 when it is placed and half as much HOT_HALF_LIFE
+later. Rather than decaying every listing's score as time passes, each bid
+is weighted by how long after a fixed epoch it was placed, and the score
+stores the logarithm of the sum:
+
+    hot_score = log(sum over bids of exp(DECAY_RATE * seconds since EPOCH))
+
+Decaying all scores by the same factor does not change their order, so
+this ranks listings exactly as their decayed bid counts would at any
+moment, and a bid only has to update the score of its own listing.
+
+The index page validates its ETag against the most recent change of any
+listing, which bids and closes update; watchlist changes do not move it,
+so the most watched ranking also carries a version: a checksum of the
+ids and watcher counts at the top of the ranking, read from the database
+with the same index scan as the ranking itself, so it is the same in
+every process.
+"""
+import math
+import zlib
+from datetime import timedelta
+
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Exp, Greatest, Least, Ln
+
+from .models import Bid, Listing
+from .pagination import EPOCH
+
+# Time after which a bid counts half as much towards the hot score
+HOT_HALF_LIFE = timedelta(hours=6)
+
+DECAY_RATE = math.log(2) / HOT_HALF_LIFE.total_seconds()
+
+# Number of listings shown on a ranking
+RANKING_SIZE = 50
+
+# Sort option -> (title, filter on the active listings, ordering); every
+# ordering is the order of its partial index
+SORTS = {
+    "hot": ("Hottest", {"hot_score__isnull": False}, ("-hot_score", "id")),
+    "watched": ("Most watched", {"watcher_count__gt": 0}, ("-watcher_count", "id")),
+    "ending": ("Ending soonest", {"ends_at__isnull": False}, ("ends_at", "id")),
+}
+
+def heat(moment):
+    """
+    Returns the logarithm of the weight of a bid placed at `moment`.
+    """
+    return DECAY_RATE * (moment - EPOCH).total_seconds()
+
+
+def hot_score_after_bid(moment):
+    """
+    Returns an expression of a listing's hot score with one more bid,
+    placed at `moment`, for Listing.objects.update().
+    """
+    bid = Value(heat(moment))
+    # log(exp(score) + exp(bid)), without leaving the range of a float
+    high, low = Greatest(F("hot_score"), bid), Least(F("hot_score"), bid)
+    return Case(
+        When(hot_score=None, then=bid),
+        default=high + Ln(1 + Exp(low - high)),
+    )
+
+
+def ranked(listings, sort):
+    """
+    Returns the top of a ranking.
+    Parameters:
+        listings: a queryset of active listings
+        sort: one of SORTS
+    Returns:
+        The first RANKING_SIZE listings of the ranking, as a queryset
+    """
+    title, filters, ordering = SORTS[sort]
+    return listings.filter(**filters).order_by(*ordering)[:RANKING_SIZE]
+
+
+def watched_version():
+    """
+    Returns the current version of the most watched ranking.
+    """
+    top = ranked(Listing.objects.filter(isActive=True), "watched").values_list("pk", "watcher_count")
+    return format(zlib.crc32(",".join(f"{pk}:{count}" for pk, count in top).encode()), "x")
+
+
+def rebuild():
+    """
+    Recomputes the hot score of every listing from its bids, for bids
+    inserted without place_bid(), like bulk_create.
+    """
+    scores = {}
+    # The owner's opening price is stored as a bid, but is not bid activity
+    bids = Bid.objects.filter(listing__isnull=False).exclude(user=F("listing__owner"))
+    for listingId, createdAt in bids.values_list("listing_id", "created_at").iterator():
+        weight = heat(createdAt)
+        score = scores.get(listingId)
+        if score is None:
+            scores[listingId] = weight
+        else:
+            high, low = max(score, weight), min(score, weight)
+            scores[listingId] = high + math.log1p(math.exp(low - high))
+    Listing.objects.update(hot_score=None)
+    # One UPDATE per batch of listings, each score chosen with a CASE
+    ids = list(scores)
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        Listing.objects.filter(pk__in=batch).update(hot_score=Case(
+            *[When(pk=pk, then=Value(scores[pk])) for pk in batch]
+        ))
+
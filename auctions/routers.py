@@ -0,0 +1,119 @@
+"""
+Read-replica routing for the browse pages.
+
+Only views decorated with @replica_reads read from a replica; every other
+view, management command and background worker reads from the primary, so
+code that reads and then writes never acts on stale rows.
+
+Replication lags behind the primary, so a user who has just placed a bid
+or posted a comment could read a page without it. To give users their own
+writes back, ReplicaMiddleware stores a marker in the session after every
+successful write request, and that user's reads stay on the primary until
+the marker expires (AUCTIONS_READ_YOUR_WRITES_SECONDS).
+
+The replicas are the database aliases listed in AUCTIONS_READ_REPLICAS.
+With none configured, every read goes to the primary.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+# Session key holding the time until which the user's reads use the primary
+PRIMARY_UNTIL = "auctions_primary_until"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# True while a view that may read from a replica is running
+_replicaReads = ContextVar("auctions_replica_reads", default=False)
+
+
+def replica_reads(view):
+    """
+    Marks a read-only view whose queries may be served by a replica.
+    """
+    view.replica_reads = True
+    return view
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of @replica_reads views to a random replica and
+    everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "AUCTIONS_READ_REPLICAS", [])
+        if replicas and _replicaReads.get():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Lets @replica_reads views read from a replica, unless the user has
+    written recently, and marks the session of users who write.
+    Must come after SessionMiddleware and AuthenticationMiddleware.
+    Works under both WSGI and ASGI; the replica flag is a context variable,
+    which sync_to_async hands on to the threads running the queries.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replicaReads.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replicaReads.reset(token)
+        if self.wrote(request, response):
+            self.mark_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _replicaReads.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replicaReads.reset(token)
+        if self.wrote(request, response):
+            # The session may not be loaded yet, which takes a query
+            await sync_to_async(self.mark_primary)(request)
+        return response
+
+    def wrote(self, request, response):
+        # Without replicas every read is already up to date
+        replicas = getattr(settings, "AUCTIONS_READ_REPLICAS", [])
+        readOnly = getattr(request, "replica_reads", False)
+        return replicas and request.method not in SAFE_METHODS and not readOnly and response.status_code < 400
+
+    def mark_primary(self, request):
+        request.session[PRIMARY_UNTIL] = time.time() + settings.AUCTIONS_READ_YOUR_WRITES_SECONDS
+
+    def process_view(self, request, view, args, kwargs):
+        if not getattr(settings, "AUCTIONS_READ_REPLICAS", []) or not getattr(view, "replica_reads", False):
+            return None
+        request.replica_reads = True
+        # Read the marker, and load the session and user, from the primary:
+        # a user who has just logged in may not have reached the replica yet
+        if request.session.get(PRIMARY_UNTIL, 0) > time.time():
+            return None
+        request.user.is_authenticated
+        _replicaReads.set(True)
+        return None
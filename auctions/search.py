@@ -0,0 +1,181 @@
+"""
+Full-text search over listing titles and descriptions.
+
+- On SQLite the listings are indexed in an FTS5 table, auctions_listing_fts,
+  that triggers on auctions_listing keep in sync; results are ranked with
+  bm25(), with matches in the title weighing more than in the description.
+- On PostgreSQL a GIN index on the listing's tsvector is used and results
+  are ranked with ts_rank().
+- Other databases fall back to icontains scans.
+
+Results are ranked, so they are paginated by page number rather than by
+an id cursor.
+"""
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import Listing
+from .pagination import PAGE_SIZE, Page
+
+# Weight of a match in the title compared to one in the description
+TITLE_WEIGHT = 10.0
+
+SQLITE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts USING fts5(
+    title, description, content='auctions_listing', content_rowid='id'
+)
+"""
+
+# Django rebuilds SQLite tables on some schema changes, which drops their
+# triggers, so they are also reinstalled after every migrate
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS auctions_listing_fts_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO auctions_listing_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+POSTGRES_VECTOR = "to_tsvector('english', title || ' ' || description)"
+
+POSTGRES_INDEX = f"CREATE INDEX IF NOT EXISTS auctions_listing_search_idx ON auctions_listing USING GIN ({POSTGRES_VECTOR})"
+
+
+def install(schema_editor):
+    """
+    Creates the full-text index of the database behind `schema_editor`.
+    Missing SQLite triggers are recreated and the index is rebuilt, so it
+    also repairs the index after a table rebuild.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(SQLITE_TABLE)
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'auctions_listing_fts_%'")
+            if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+                return
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(trigger)
+            cursor.execute("INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')")
+    elif vendor == "postgresql":
+        schema_editor.execute(POSTGRES_INDEX)
+
+
+def uninstall(schema_editor):
+    """
+    Drops the full-text index created by install().
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for name in ("insert", "delete", "update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS auctions_listing_fts_{name}")
+        schema_editor.execute("DROP TABLE IF EXISTS auctions_listing_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS auctions_listing_search_idx")
+
+
+def fts_query(text):
+    """
+    Turns user input into an FTS5 query matching every word, the last one
+    as a prefix. Words are quoted so FTS5 operators in the input are not
+    interpreted.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not words:
+        return None
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def search_listings(text, category=None, active=True, page=1, size=PAGE_SIZE):
+    """
+    Searches listing titles and descriptions, best matches first.
+    Parameters:
+        text: the words to search for
+        category: only return listings in the category with this name
+        active: True for open listings, False for closed ones, None for both
+        page: the 1-based page number
+        size: the maximum number of listings on the page
+    Returns:
+        A Page of listings with their category and owner joined; its
+        next_cursor is the next page number, or None on the last page
+    """
+    offset = (page - 1) * size
+    # Fetch one extra id so we know whether there is a next page
+    ids = _matching_ids(text, category, active, size + 1, offset)
+    hasNext = len(ids) > size
+    ids = ids[:size]
+
+    listings = Listing.objects.select_related("category", "owner").in_bulk(ids)
+    return Page([listings[pk] for pk in ids if pk in listings], page + 1 if hasNext else None)
+
+
+def _matching_ids(text, category, active, limit, offset):
+    filters, params = [], []
+    if active is not None:
+        filters.append('l."isActive" = %s')
+        params.append(active)
+    if category is not None:
+        filters.append('l.category_id IN (SELECT id FROM auctions_category WHERE "categoryName" = %s)')
+        params.append(category)
+    where = "".join(f" AND {condition}" for condition in filters)
+
+    if connection.vendor == "sqlite":
+        match = fts_query(text)
+        if match is None:
+            return []
+        sql = (
+            "SELECT l.id FROM auctions_listing_fts f JOIN auctions_listing l ON l.id = f.rowid"
+            f" WHERE auctions_listing_fts MATCH %s{where}"
+            f" ORDER BY bm25(auctions_listing_fts, {TITLE_WEIGHT}, 1.0), l.id LIMIT %s OFFSET %s"
+        )
+        params = [match, *params, limit, offset]
+    elif connection.vendor == "postgresql":
+        if not text.split():
+            return []
+        sql = (
+            f"SELECT l.id FROM auctions_listing l WHERE {POSTGRES_VECTOR} @@ plainto_tsquery('english', %s){where}"
+            f" ORDER BY ts_rank({POSTGRES_VECTOR}, plainto_tsquery('english', %s)) DESC, l.id LIMIT %s OFFSET %s"
+        )
+        params = [text, *params, text, limit, offset]
+    else:
+        return _scan_ids(text, category, active, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _scan_ids(text, category, active, limit, offset):
+    # Unranked icontains scan, for databases without a full-text index
+    queryset = Listing.objects.all()
+    for word in text.split():
+        queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+    if active is not None:
+        queryset = queryset.filter(isActive=active)
+    if category is not None:
+        queryset = queryset.filter(category__categoryName=category)
+    return list(queryset.order_by("pk").values_list("pk", flat=True)[offset:offset + limit])
+
+
+@receiver(post_migrate)
+def _reinstall(sender, using, **kwargs):
+    if sender.name != "auctions":
+        return
+    with connections[using].schema_editor() as schema_editor:
+        install(schema_editor)
@@ -0,0 +1,22 @@
+"""
+Signals sent when the state of a listing changes.
+
+They are sent once the change has been committed, with the primary key of
+the listing as ``listing_id``. Caches and other derived data connect to
+them instead of being updated from every view that changes a listing.
+Watchlist changes may touch many listings at once and pass their primary
+keys as ``listing_ids``.
+"""
+from django.dispatch import Signal
+
+# Sent when a bid has been accepted on a listing
+bid_placed = Signal()
+
+# Sent when a comment has been added to a listing
+comment_added = Signal()
+
+# Sent when a listing has been closed
+auction_closed = Signal()
+
+# Sent when users have started or stopped watching listings
+watchers_changed = Signal()
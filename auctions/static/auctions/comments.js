@@ -0,0 +1,37 @@
+// Appends the next page of older comments when "Load more comments" is clicked
+(function () {
+    var button = document.getElementById("loadComments");
+    if (!button || !window.fetch) {
+        return;
+    }
+    var list = document.getElementById("comments");
+    button.addEventListener("click", function () {
+        button.disabled = true;
+        fetch(button.dataset.url, {headers: {"Accept": "application/json"}})
+            .then(function (response) {
+                return response.json();
+            })
+            .then(function (page) {
+                page.comments.forEach(function (comment) {
+                    var item = document.createElement("li");
+                    item.className = "list-group-item";
+                    item.appendChild(document.createTextNode(comment.message));
+                    var author = document.createElement("p");
+                    var name = document.createElement("strong");
+                    name.textContent = comment.author;
+                    author.append("Posted by ", name, " ");
+                    item.appendChild(author);
+                    list.appendChild(item);
+                });
+                if (page.next) {
+                    button.dataset.url = page.next;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(function () {
+                button.disabled = false;
+            });
+    });
+})();
@@ -0,0 +1,18 @@
+// Updates the price and bid count of a listing page from its event stream
+(function () {
+    var script = document.currentScript;
+    if (!window.EventSource || !script) {
+        return;
+    }
+    var source = new EventSource(script.dataset.stream);
+    source.addEventListener("listing", function (message) {
+        var listing = JSON.parse(message.data);
+        document.getElementById("livePrice").textContent = listing.price;
+        document.getElementById("liveBids").textContent = listing.bids;
+        if (listing.closed) {
+            source.close();
+            // Reload to show the closed auction and its winner
+            window.location.reload();
+        }
+    });
+})();
@@ -0,0 +1,106 @@
+"""
+Background thumbnail pipeline for listing images.
+
+Uploads are stored as-is; once the listing is committed, a worker thread
+renders a fixed-size JPEG thumbnail and a WebP variant and links them to
+the listing. File names are derived from a hash of the original image, so
+the same upload is only processed and stored once and the files can be
+cached forever. Until the thumbnails exist, pages fall back to the
+original image.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import Listing
+
+logger = logging.getLogger(__name__)
+
+# Width and height of the thumbnails, cropped to fill
+THUMBNAIL_SIZE = (400, 300)
+
+# Formats rendered for every image, with their file extension
+FORMATS = {
+    "thumbnail": ("JPEG", "jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    "thumbnail_webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "AUCTIONS_THUMBNAIL_WORKERS", 2),
+    thread_name_prefix="thumbnails",
+)
+
+
+def schedule(listing_id):
+    """
+    Queues the thumbnails of a listing to be rendered once the current
+    transaction commits.
+    """
+    transaction.on_commit(lambda: submit(listing_id))
+
+
+def submit(listing_id):
+    """
+    Renders the thumbnails of a listing on a worker thread.
+    Returns a Future that resolves to True if thumbnails were created.
+    """
+    return _executor.submit(_run, listing_id)
+
+
+def _run(listing_id):
+    close_old_connections()
+    try:
+        return generate(listing_id)
+    except Exception:
+        logger.exception("Could not create thumbnails for listing %s", listing_id)
+        return False
+    finally:
+        # Worker threads must not keep connections open
+        connection.close()
+
+
+def generate(listing_id):
+    """
+    Renders and stores the thumbnails of a listing.
+    Parameters:
+        listing_id: primary key of the listing
+    Returns:
+        True if thumbnails were created, False if the listing has no image
+    """
+    listing = Listing.objects.filter(pk=listing_id).only("image").first()
+    if listing is None or not listing.image:
+        return False
+
+    with listing.image.open("rb") as original:
+        data = original.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        thumbnail = ImageOps.fit(image.convert("RGB"), THUMBNAIL_SIZE, Image.LANCZOS)
+
+    names = {}
+    width, height = THUMBNAIL_SIZE
+    for field, (imageFormat, extension, options) in FORMATS.items():
+        if imageFormat == "WEBP" and not features.check("webp"):
+            continue
+        name = f"thumbnails/{digest}_{width}x{height}.{extension}"
+        # The same upload always produces the same file
+        if not default_storage.exists(name):
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, imageFormat, **options)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        names[field] = name
+
+    # The API serves the thumbnail under the listing's version
+    Listing.objects.filter(pk=listing_id).update(**names, version=F("version") + 1, updated_at=timezone.now())
+    return True
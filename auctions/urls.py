@@ -1,8 +1,8 @@
 # Import the path function from Django's URLconf module
 from django.urls import path
 
-# Import the views defined in the auctions app
-from . import views
+# Import the views defined in the auctions app, and the JSON API
+from . import api, views
 
 # Define the URL patterns for the auctions app
 urlpatterns = [
@@ -18,14 +18,26 @@ urlpatterns = [
     path("create", views.create_listing, name="create"),
     # URL for the view to display listings in a selected category
     path("displayCategory", views.displayCategory, name="displayCategory"),
+    # URL for the full-text search over listings
+    path("search", views.search, name="search"),
     # URL for the listing detail view
     path("listing/<int:id>", views.listing, name="listing"),
+    # URL for the stream of live price updates of a listing
+    path("listing/<int:id>/stream", views.listingStream, name="listingStream"),
+    # Returns a page of a listing's comments as JSON, for "load more"
+    path("listing/<int:id>/comments", views.loadComments, name="loadComments"),
     # URL for the view to remove a listing from the user's watchlist
     path("removeWatchList/<int:id>", views.removeWatchList, name="removeWatchList"),
     # URL for the view to add a listing to the user's watchlist
     path("addWatchList/<int:id>", views.addWatchList, name="addWatchList"),
+    # URL for the view to add or remove many listings to or from the user's watchlist at once
+    path("editWatchList", views.editWatchList, name="editWatchList"),
     # URL for the view to display the user's watchlist
     path("watchlist", views.displayWatchList, name="watchlist"),
+    # URL for the view to display the user's notifications
+    path("notifications", views.notificationInbox, name="notifications"),
+    # URL for the view to mark the user's notifications as read
+    path("readNotifications", views.readNotifications, name="readNotifications"),
     # URL for the view to add a comment to a listing
     path("addComment/<int:id>", views.addComment, name="addComment"),
     # URL for the view to add a bid to a listing
@@ -33,5 +45,25 @@ urlpatterns = [
     # URL for the view to close an auction and select a winner
     path("closeAuction/<int:id>", views.closeAuction, name="closeAuction"),
     path("closed_listings", views.closed_listings, name="closed_listings"),
-    path("closedDetails/<int:id>", views.closedDetails, name="closedDetails")
+    path("closedDetails/<int:id>", views.closedDetails, name="closedDetails"),
+    # URL for the staff-only hit/miss counters of the listing fragment cache
+    path("cacheStats", views.cacheStats, name="cacheStats"),
+    # URL for the staff-only page of per-view query counts and timings
+    path("profiling", views.profilingStats, name="profiling"),
+    # URL for the per-view stats in the Prometheus text format
+    path("metrics", views.metrics, name="metrics"),
+
+    # Version 1 of the JSON API, see auctions/api.py
+    # Active listings, paginated
+    path("api/v1/listings", api.listings, name="apiListings"),
+    # A single listing, with an ETag for conditional requests
+    path("api/v1/listings/<int:id>", api.listing, name="apiListing"),
+    # The bids on a listing, and placing a bid
+    path("api/v1/listings/<int:id>/bids", api.bids, name="apiBids"),
+    # The comments on a listing, and adding a comment
+    path("api/v1/listings/<int:id>/comments", api.comments, name="apiComments"),
+    # The listings the user watches
+    path("api/v1/watchlist", api.watchlist, name="apiWatchlist"),
+    # Watching and unwatching a listing
+    path("api/v1/watchlist/<int:id>", api.watch, name="apiWatch"),
 ]
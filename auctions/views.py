@@ -1,24 +1,179 @@
+import asyncio
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
 
+from . import categories, conditional, fragments, live, notifications, profiling, rankings, thumbnails
+from .bidding import abid_history, bid_history, close_auction, parse_amount, place_bid
+from .fragments import arender_fragment, render_fragment
 from .models import *
+from .pagination import akeyset_page, atimeline_page, keyset_page, parse_cursor, timeline_page
+from .routers import replica_reads
+from .search import search_listings
+from .signals import comment_added
+from .watchlist import WATCHLIST_BATCH_SIZE, awatched_ids, unwatch, watch, watched_ids
+
+
+# Auction durations in days offered on the create listing page
+AUCTION_DURATIONS = (1, 3, 7, 14, 30)
+
+# Number of comments shown at first and loaded by every "load more"
+COMMENTS_PAGE_SIZE = 20
+
+# The fragments of the listing page are shared by every user until the
+# listing changes, so they are always rendered from the primary: one
+# rendered from a lagging replica would outlive the replica's lag
+PRIMARY = "default"
+
+
+def activeListingsFeed(request, **filters):
+    """
+    Returns one keyset-paginated page of active listings.
+    The category and owner of every listing are joined into the same query
+    and the price is read from current_price, so rendering a card does not
+    cost any extra queries.
+    Parameters:
+        request: HTTP request object, the page cursor is read from ?after=
+        filters: extra filters applied to the active listings
+    Returns:
+        A Page of listings
+    """
+    return keyset_page(activeListings(**filters), request.GET.get("after"))
+
+
+def activeListings(**filters):
+    return Listing.objects.filter(isActive=True, **filters).select_related("category", "owner")
+
+
+async def loadUser(request):
+    """
+    Returns the user of a request, for async views.
+    The session and user are loaded lazily with blocking queries, so they
+    are loaded in a thread; the ETag functions, run in a thread as well,
+    and the view then share the same user.
+    """
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def feedUrl(viewName, page, **params):
+    """
+    Builds the URL of the page following `page`, or None on the last page.
+    """
+    if page.next_cursor is None:
+        return None
+    params["after"] = page.next_cursor
+    return f"{reverse(viewName)}?{urlencode(params)}"
+
+
+def commentPage(listingId, cursor=None):
+    """
+    Returns one page of the comments of a listing, newest first, with the
+    author of every comment joined into the same query.
+    """
+    return timeline_page(listingCommentsQuery(listingId), cursor, COMMENTS_PAGE_SIZE)
+
+
+def listingCommentsQuery(listingId):
+    return Comment.objects.filter(listing_id=listingId).select_related("author")
+
+
+def commentsUrl(listingId, page):
+    """
+    Builds the URL of the comments following `page`, or None on the last page.
+    """
+    if page.next_cursor is None:
+        return None
+    return f"{reverse('loadComments', args=(listingId, ))}?{urlencode({'after': page.next_cursor})}"
+
+
+def primaryListing(listingData):
+    """
+    Returns the listing as read from the primary, reading it again if it
+    came from a replica.
+    """
+    if listingData._state.db == PRIMARY:
+        return listingData
+    return Listing.objects.using(PRIMARY).select_related("owner", "high_bidder").get(pk=listingData.pk)
+
+
+def renderComments(listingId, changedAt):
+    """
+    Returns the first page of comments of a listing rendered as HTML, from
+    the fragment cache if possible; `changedAt` is the listing's updated_at.
+    """
+    def context():
+        page = timeline_page(listingCommentsQuery(listingId).using(PRIMARY), None, COMMENTS_PAGE_SIZE)
+        return {"comments": page, "nextComments": commentsUrl(listingId, page)}
+    return render_fragment(listingId, "comments", changedAt, context)
 
 
-# This function handles the rendering of the index page with all active listings and categories
-def index(request):
-    # Get all active listings
-    activeListings = Listing.objects.filter(isActive=True)
-    allCategories = Category.objects.all()
+async def arenderComments(listingId, changedAt):
+    """
+    renderComments() for async views.
+    """
+    async def context():
+        page = await atimeline_page(listingCommentsQuery(listingId).using(PRIMARY), None, COMMENTS_PAGE_SIZE)
+        return {"comments": page, "nextComments": commentsUrl(listingId, page)}
+    return await arender_fragment(listingId, "comments", changedAt, context)
+
+
+# This function handles the rendering of the index page with active listings and categories
+@replica_reads
+@conditional.cacheable
+@conditional.condition(etag_func=conditional.feed_etag)
+async def index(request):
+    currentUser = await loadUser(request)
+    # ?sort= shows the top of a ranking instead of the feed, read in one
+    # query from the ranking's index
+    sort = request.GET.get("sort")
+    if sort in rankings.SORTS:
+        listingsQuery = arankedListings(sort)
+    else:
+        sort = None
+        listingsQuery = akeyset_page(activeListings(), request.GET.get("after"))
+    # The current page of active listings, the user's watchlist and the
+    # categories, from the process-wide cache, do not depend on each other,
+    # so they are read concurrently
+    page, watchedIds, allCategories = await asyncio.gather(
+        listingsQuery,
+        awatched_ids(currentUser),
+        categories.aall_categories(),
+    )
     return render(request, "auctions/index.html", {
-        "listings": activeListings,
-        "category": allCategories
+        "listings": page,
+        "watchedIds": watchedIds,
+        "nextPage": feedUrl("index", page) if sort is None else None,
+        "category": allCategories,
+        "sorts": [(name, title) for name, (title, filters, ordering) in rankings.SORTS.items()],
+        "selectedSort": sort
     })
 
+
+async def arankedListings(sort):
+    """
+    Returns the top active listings of a ranking, see auctions/rankings.py.
+    """
+    return [listing async for listing in rankings.ranked(activeListings(), sort)]
+
+@replica_reads
+@conditional.cacheable
+@conditional.condition(etag_func=conditional.closed_listing_etag, last_modified_func=conditional.listing_modified)
 def closedDetails(request, id):
     """
     Handles the rendering of the details page for a specific listing.
@@ -29,24 +184,29 @@ def closedDetails(request, id):
         An HTTP response with the listing page rendered
     """
     # Get the listing data from the database using the provided primary key
-    listingData = Listing.objects.get(pk=id)
+    listingData = Listing.objects.select_related("owner").get(pk=id)
     
-    # Check if the current user is in the watchlist of the listing
-    isListingInWatchList = request.user in listingData.watchlist.all()
-    
-    # Get all comments for the current listing
-    allComments = Comment.objects.filter(listing=listingData)
+    # Check if the current user is in the watchlist of the listing, without
+    # loading the rest of their watchlist
+    isListingInWatchList = listingData.is_watched_by(request.user)
     
+    # Get the first page of comments, the rest is loaded on demand
+    listingComments = renderComments(listingData.pk, listingData.updated_at)
+
     # Check if the current user is the owner of the listing
     isOwner = request.user.username == listingData.owner.username
     
     # Render the listing page with the relevant data
     return render(request, "auctions/closedDetails.html", {
         "listing": listingData,
+        "listingComments": listingComments,
         "isListingInWatchList": isListingInWatchList,
         "isOwner": isOwner
     })
 
+@replica_reads
+@conditional.cacheable
+@conditional.condition(etag_func=conditional.closed_feed_etag)
 def closed_listings(request):
     closed_listing = Listing.objects.filter(isActive=False)
     context = {
@@ -57,94 +217,121 @@ def closed_listings(request):
 # This function handles the closing of a listing and rendering the updated listing page
 def closeAuction(request, id):
     # Get the listing data for the given id
-    listingData = Listing.objects.get(pk=id)
-    # Set the listing to inactive
-    listingData.isActive = False
-    # Save the updated listing data
-    listingData.save()
+    listingData = Listing.objects.select_related("owner").get(pk=id)
     # Check if the user who requested to close the auction is the owner of the listing
     isOwner = request.user.username == listingData.owner.username
-    # Check if the listing is in the current user's watchlist
-    isListingInWatchList = request.user in listingData.watchlist.all()
-    # Get all comments for the listing
-    allComments = Comment.objects.filter(listing=listingData)
+    # Only the owner may close the auction; the winner is taken from the bid history
+    closed = isOwner and close_auction(id)
     # Render the updated listing page
-    return render(request, "auctions/listing.html", {
-        "listing": listingData,
-        "isListingInWatchList": isListingInWatchList,
-        "allComments": allComments,
-        "isOwner": isOwner,
-        "update": True,
-        "message": "Close Successful"
+    return renderListing(request, id, {
+        "update": closed,
+        "message": "Close Successful" if closed else "Close failed"
     })
 
 # This function handles the removal of a listing from the current user's watchlist
 def removeWatchList(request, id):
-    # Get the listing data for the given id
-    listingData = Listing.objects.get(pk=id)
-    # Get the current user
-    currentUser = request.user
-    # Remove the current user from the listing's watchlist
-    listingData.watchlist.remove(currentUser)
+    # Remove the listing from the current user's watchlist, and its watcher count
+    unwatch(request.user, [id])
     # Redirect to the listing page
     return HttpResponseRedirect(reverse("listing",args=(id, )))
 
 # This function handles the addition of a listing to the current user's watchlist
 def addWatchList(request, id):
-    # Get the listing data for the given id
-    listingData = Listing.objects.get(pk=id)
-    # Get the current user
-    currentUser = request.user
-    # Add the current user to the listing's watchlist
-    listingData.watchlist.add(currentUser)
+    # Add the listing to the current user's watchlist, and to its watcher count
+    watch(request.user, [id])
     
     # Redirect to the listing page
     return HttpResponseRedirect(reverse("listing",args=(id, )))
 
+
+@login_required
+@require_POST
+def editWatchList(request):
+    """
+    Adds or removes the listings ticked on a listings page to or from the
+    user's watchlist, in one transaction.
+    Parameters:
+        request: HTTP request object with the listing ids, the action
+                 ("add" or "remove") and the page to go back to
+    Returns:
+        A redirect to the page the form was sent from
+    """
+    listingIds = [int(value) for value in request.POST.getlist("listing")[:WATCHLIST_BATCH_SIZE] if value.isdigit()]
+    if request.POST.get("action") == "remove":
+        unwatch(request.user, listingIds)
+    else:
+        watch(request.user, listingIds)
+    # Go back to the page the listings were ticked on
+    nextUrl = request.POST.get("next", "")
+    if not url_has_allowed_host_and_scheme(nextUrl, allowed_hosts={request.get_host()}):
+        nextUrl = reverse("watchlist")
+    return HttpResponseRedirect(nextUrl)
+
 # This function is responsible for displaying the watchlist page for the user
-def displayWatchList(request):
+@replica_reads
+async def displayWatchList(request):
     # Get the current user making the request
-    currentUser = request.user
-    # Get all the listings that are in the user's watchlist
-    listings = currentUser.listingWatchlist.all()
+    currentUser = await loadUser(request)
+    # Get all the listings that are in the user's watchlist, by primary key
+    # from the cached set of watched ids
+    watchedIds = await awatched_ids(currentUser)
+    listings = [listing async for listing in Listing.objects.filter(pk__in=watchedIds).order_by("pk")]
     # Render the watchlist page, passing in the listings to display
     return render(request, "auctions/watchlist.html", {
-        "listings": listings
-        
+        "listings": listings,
+        "watchedIds": watchedIds
+    })
+
+# Number of notifications shown on the inbox page
+NOTIFICATIONS_PAGE_SIZE = 50
+
+
+@login_required
+def notificationInbox(request):
+    """
+    Renders the user's newest notifications, unread ones highlighted.
+    Parameters:
+        request: HTTP request object
+    Returns:
+        An HTTP response with the notifications page rendered
+    """
+    # Read newest first from the notification_user_created_idx index
+    userNotifications = list(
+        Notification.objects.filter(user=request.user).select_related("listing")
+        .order_by("-created_at")[:NOTIFICATIONS_PAGE_SIZE]
+    )
+    return render(request, "auctions/notifications.html", {
+        "notifications": [
+            (notification, notifications.describe(notifications.Notice(
+                notification.user_id, notification.listing_id, notification.listing.title,
+                notification.kind, notification.count
+            )))
+            for notification in userNotifications
+        ],
     })
 
+
+@login_required
+@require_POST
+def readNotifications(request):
+    """
+    Marks all of the user's notifications as read, so new events start new
+    notifications instead of being added to them.
+    """
+    Notification.objects.filter(user=request.user, read=False).update(read=True)
+    return HttpResponseRedirect(reverse("notifications"))
+
 # This function is responsible for adding a new bid to a listing
 def addBid(request, id):
     # Get the new bid amount from the request
-    newBid = request.POST['newBid']
-    # Get the listing data for the given id
-    listingData = Listing.objects.get(pk=id)
-    # Check if the current user is the owner of the listing
-    isOwner = request.user.username == listingData.owner.username
-    # If the new bid is higher than the current highest bid, update the bid
-    if int(newBid) > listingData.price.bid:
-        # Create a new bid object with the user and bid amount
-        updateBid = Bid(user=request.user, bid=int(newBid))
-        # Save the bid to the database
-        updateBid.save()
-        # Update the listing with the new highest bid
-        listingData.price = updateBid
-        listingData.save()
-        # Render the listing page with a success message
-        return render(request, "auctions/listing.html", {
-            "listing": listingData,
-            "message": "Bid Successful",
-            "update": True,
-            "isOwner": isOwner
-        })
-    else:
-        # Render the listing page with a failure message
-        return render(request, "auctions/listing.html", {
-            "listing": listingData,
-            "message": "Bid failed",
-            "update": False,
-            "isOwner": isOwner
-        }) 
+    newBid = parse_amount(request.POST['newBid'])
+    # Place the bid; it is only accepted if it is higher than the current price
+    accepted = newBid is not None and place_bid(id, request.user, newBid) is not None
+    # Render the listing page with a success or failure message
+    return renderListing(request, id, {
+        "message": "Bid Successful" if accepted else "Bid failed",
+        "update": accepted
+    })
     
 # This function is responsible for adding a new comment to a listing
 def addComment(request, id):
@@ -161,42 +348,170 @@ def addComment(request, id):
         listing=listingData,
         message=message
     )
-    # Save the comment to the database
-    newComment.save()
+    # Save the comment to the database, and tell the listing's watchers
+    # about it, in one transaction
+    with transaction.atomic():
+        newComment.save()
+        notifications.record(NotificationEvent.COMMENT, listingData.pk, actor=currentUser)
+    # Let the caches of the listing know about the new comment
+    comment_added.send(sender=Comment, listing_id=listingData.pk)
     # Redirect the user back to the listing page
     return HttpResponseRedirect(reverse("listing",args=(id, )))
 
 
-def listing(request, id):
+def renderListing(request, id, extra=None):
     """
-    Handles the rendering of the details page for a specific listing.
+    Renders the details page of a listing.
+    The listing body and the comments are the same for every visitor and
+    come from the fragment cache; only the parts that depend on the current
+    user are worked out on every request.
     Parameters:
         request: HTTP request object
         id: primary key of the listing in the database
+        extra: additional template context, like a status message
     Returns:
         An HTTP response with the listing page rendered
     """
     # Get the listing data from the database using the provided primary key
-    listingData = Listing.objects.get(pk=id)
-    
+    listingData = Listing.objects.select_related("owner", "high_bidder").get(pk=id)
+
+    # Get the shared parts of the page, as of the listing's updated_at; bids
+    # and the first page of comments are only queried on a cache miss
+    listingBody = render_fragment(id, "body", listingData.updated_at, lambda: {
+        "listing": primaryListing(listingData),
+        "bidHistory": bid_history(id, using=PRIMARY)
+    })
+    listingComments = renderComments(id, listingData.updated_at)
+
+    # The watchlist was already loaded, and cached, for the page's ETag
+    return listingPage(request, listingData, watched_ids(request.user), listingBody, listingComments, extra)
+
+
+def listingPage(request, listingData, watchedIds, listingBody, listingComments, extra=None):
+    """
+    Renders the listing page from its parts.
+    """
     # Check if the current user is in the watchlist of the listing
-    isListingInWatchList = request.user in listingData.watchlist.all()
-    
-    # Get all comments for the current listing
-    allComments = Comment.objects.filter(listing=listingData)
-    
+    isListingInWatchList = listingData.pk in watchedIds
+
     # Check if the current user is the owner of the listing
     isOwner = request.user.username == listingData.owner.username
-    
+
     # Render the listing page with the relevant data
     return render(request, "auctions/listing.html", {
         "listing": listingData,
+        "listingBody": listingBody,
+        "listingComments": listingComments,
         "isListingInWatchList": isListingInWatchList,
-        "allComments": allComments,
-        "isOwner": isOwner
+        "isOwner": isOwner,
+        **(extra or {})
+    })
+
+
+@replica_reads
+@conditional.cacheable
+@conditional.condition(etag_func=conditional.listing_etag, last_modified_func=conditional.listing_modified)
+async def listing(request, id):
+    """
+    Handles the rendering of the details page for a specific listing.
+    The listing, the user's watchlist, the listing body and the comments
+    are read concurrently.
+    Parameters:
+        request: HTTP request object
+        id: primary key of the listing in the database
+    Returns:
+        An HTTP response with the listing page rendered
+    """
+    # The fragments are looked up by the updated_at read for the ETag,
+    # before the listing itself
+    changedAt = await sync_to_async(conditional.listing_changed_at)(request, id)
+    if changedAt is None:
+        raise Http404("Listing not found")
+    currentUser = await loadUser(request)
+    listingQuery = asyncio.ensure_future(Listing.objects.select_related("owner", "high_bidder").aget(pk=id))
+
+    async def bodyContext():
+        # Only needed on a cache miss, and then shares the listing query
+        # unless it was answered by a replica
+        return {
+            "listing": await sync_to_async(primaryListing)(await listingQuery),
+            "bidHistory": await abid_history(id, using=PRIMARY),
+        }
+
+    try:
+        listingData, watchedIds, listingBody, listingComments = await asyncio.gather(
+            listingQuery,
+            awatched_ids(currentUser),
+            arender_fragment(id, "body", changedAt, bodyContext),
+            arenderComments(id, changedAt),
+        )
+    except Listing.DoesNotExist:
+        raise Http404("Listing not found")
+    return listingPage(request, listingData, watchedIds, listingBody, listingComments)
+
+
+@replica_reads
+def loadComments(request, id):
+    """
+    Returns a page of the comments of a listing as JSON, for the "load more"
+    button of the listing page.
+    Parameters:
+        request: HTTP request object, the page cursor is read from ?after=
+        id: primary key of the listing in the database
+    Returns:
+        A JSON response with the comments and the URL of the next page
+    """
+    page = commentPage(id, request.GET.get("after"))
+    return JsonResponse({
+        "comments": [
+            {
+                "id": comment.pk,
+                "author": comment.author.username if comment.author else None,
+                "message": comment.message,
+                "created_at": comment.created_at.isoformat(),
+            }
+            for comment in page
+        ],
+        "next": commentsUrl(id, page),
     })
 
 
+async def listingStream(request, id):
+    """
+    Streams live updates of a listing's price, bid count and closed state
+    as Server-Sent Events. Meant to be served through commerce/asgi.py,
+    where an open stream does not hold a worker thread. Under WSGI, which
+    would hold a thread for as long as the stream is open and only send
+    it once it ends, the current state is sent as a single event and the
+    client polls again after live.RETRY_INTERVAL.
+    Parameters:
+        request: HTTP request object
+        id: primary key of the listing in the database
+    Returns:
+        A text/event-stream response, streaming under ASGI
+    """
+    listingData = await Listing.objects.filter(pk=id).values(*live.SNAPSHOT_FIELDS).afirst()
+    if listingData is None:
+        raise Http404("Listing not found")
+    if not isinstance(request, ASGIRequest):
+        response = HttpResponse(live.single_event(live.snapshot(listingData)), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        return response
+    response = StreamingHttpResponse(live.stream(id, live.snapshot(listingData)), content_type="text/event-stream")
+    # Stop caches and proxies from buffering the stream
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@staff_member_required
+def cacheStats(request):
+    """
+    Returns the hit and miss counters of the listing fragment cache as JSON.
+    """
+    return JsonResponse(fragments.stats())
+
+
 def create_listing(request):
     """
     Handles the creation of a new listing.
@@ -211,9 +526,10 @@ def create_listing(request):
     
     # If the request method is GET, render the create listing page with a list of all categories
     if request.method == "GET":
-        allCategories = Category.objects.all()
+        allCategories = categories.all_categories()
         return render(request, "auctions/create.html", {
-            "category": allCategories
+            "category": allCategories,
+            "durations": AUCTION_DURATIONS
         })
     
     # If the request method is POST, create a new listing with the provided data
@@ -224,6 +540,11 @@ def create_listing(request):
         price = request.POST["price"]
         category = request.POST["category"]
         currentUser = request.user
+        # Get the auction duration in days, if one was chosen
+        duration = request.POST.get("duration")
+        endsAt = None
+        if duration and duration.isdigit() and int(duration) in AUCTION_DURATIONS:
+            endsAt = timezone.now() + timedelta(days=int(duration))
         
         # Get the category data from the database using the provided category name
         categoryData = Category.objects.get(categoryName=category)
@@ -238,34 +559,114 @@ def create_listing(request):
             description=description,
             image=image,
             price=bid,
+            current_price=bid.bid,
             category=categoryData,
             owner=currentUser,
+            ends_at=endsAt,
         )
         
         newListing.save()
+
+        # Link the opening bid to the listing so it is part of its bid history
+        Bid.objects.filter(pk=bid.pk).update(listing=newListing)
+
+        # Render the thumbnails of the image in the background
+        thumbnails.schedule(newListing.pk)
         
         # Redirect to the index page
         return HttpResponseRedirect(reverse(index))
     
+@replica_reads
+@conditional.cacheable
+@conditional.condition(etag_func=conditional.feed_etag)
 def displayCategory(request):
     """
     Handles displaying items in a specific category.
+    The category is read from the form (POST) or from the query string (GET),
+    so the following pages of the feed can be linked to.
     """
-    if request.method == "POST":
-        # Get the category selected by the user
-        formCategory = request.POST["category"]
-        category = Category.objects.get(categoryName=formCategory)
-        
-        # Get all active listings in the selected category
-        activeListings = Listing.objects.filter(isActive=True, category=category)
-        
-        # Get all categories to display in the sidebar
-        allCategories = Category.objects.all()
-        
-        return render(request, "auctions/index.html", {
-            "listings": activeListings,
-            "category": allCategories
-        })
+    # Get the category selected by the user
+    formCategory = request.POST.get("category") or request.GET.get("category")
+    if formCategory is None:
+        return HttpResponseRedirect(reverse("index"))
+
+    # Get the current page of active listings in the selected category
+    page = activeListingsFeed(request, category__categoryName=formCategory)
+
+    # Get all categories to display in the sidebar, from the cache
+    allCategories = categories.all_categories()
+
+    return render(request, "auctions/index.html", {
+        "listings": page,
+        "watchedIds": watched_ids(request.user),
+        "nextPage": feedUrl("displayCategory", page, category=formCategory),
+        "category": allCategories,
+        "selectedCategory": formCategory
+    })
+
+
+@replica_reads
+def search(request):
+    """
+    Handles searching listing titles and descriptions.
+    Query string parameters:
+        q: the words to search for
+        category: only show listings in this category
+        status: "active" (default), "closed" or "all"
+        page: the page number
+    """
+    query = request.GET.get("q", "")
+    formCategory = request.GET.get("category") or None
+    status = request.GET.get("status", "active")
+    pageNumber = max(parse_cursor(request.GET.get("page")) or 1, 1)
+
+    # Get the current page of matching listings, best matches first
+    page = search_listings(query, formCategory, {"active": True, "closed": False}.get(status), pageNumber)
+
+    nextPage = None
+    if page.next_cursor is not None:
+        params = {"q": query, "status": status, "page": page.next_cursor}
+        if formCategory:
+            params["category"] = formCategory
+        nextPage = f"{reverse('search')}?{urlencode(params)}"
+
+    return render(request, "auctions/index.html", {
+        "listings": page,
+        "watchedIds": watched_ids(request.user),
+        "nextPage": nextPage,
+        "category": categories.all_categories(),
+        "selectedCategory": formCategory,
+        "query": query,
+        "status": status
+    })
+
+
+@staff_member_required
+def profilingStats(request):
+    """
+    Renders the per-view query counts and timings of this process, and its
+    latest slow requests.
+    """
+    return render(request, "auctions/profiling.html", {
+        "views": profiling.registry.views(),
+        "slowRequests": profiling.registry.slow_requests(),
+        "cache": fragments.stats()
+    })
+
+
+def metrics(request):
+    """
+    Serves the per-view stats in the Prometheus text format.
+    Available to staff users, and to scrapers sending the bearer token set
+    in AUCTIONS_METRICS_TOKEN.
+    """
+    token = settings.AUCTIONS_METRICS_TOKEN
+    authorized = request.user.is_staff or (
+        token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorized:
+        return HttpResponse("Forbidden", status=403)
+    return HttpResponse(profiling.prometheus_metrics(), content_type="text/plain; version=0.0.4")
 
 
 def login_view(request):
@@ -0,0 +1,191 @@
+"""
+Watchlist lookups that do not load every watcher of a listing, and
+watchlist changes that keep the listings' watcher counts.
+
+The ids of the listings a user watches are cached per user, so feed pages
+can mark watched listings without querying the watchlist table. The cached
+set is keyed by User.watchlist_version, which every change to the
+watchlist raises in its own transaction; the version is read with the
+user on every request, so once a change commits every process looks up
+the new set, whatever cache backend is configured.
+
+watch() and unwatch() add or remove any number of listings in a single
+transaction, and adjust Listing.watcher_count by the rows they actually
+inserted or deleted, so the most watched listings can be read from an
+index instead of counting the watchlist table. Changes made through the
+many-to-many manager instead, e.g. in the admin, are counted by the
+m2m_changed receiver below.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Listing, User
+from .signals import watchers_changed
+
+# The watchlist table joining listings and users
+Watchlist = Listing.watchlist.through
+
+# Superseded sets are never read again, the timeout evicts them
+WATCHLIST_TIMEOUT = 60 * 60
+
+# The most listings changed by one batch request
+WATCHLIST_BATCH_SIZE = 500
+
+
+def watchlist_key(user):
+    """
+    Returns the cache key of the set of listings watched by a user, as of
+    the version of their watchlist.
+    """
+    return f"auctions:watchlist:{user.pk}:{user.watchlist_version}"
+
+
+def watched_ids(user):
+    """
+    Returns the ids of the listings watched by a user as a frozenset.
+    Anonymous users do not watch anything.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = watchlist_key(user)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Watchlist.objects.filter(user_id=user.pk).values_list("listing_id", flat=True))
+        cache.set(key, ids, WATCHLIST_TIMEOUT)
+    return ids
+
+
+async def awatched_ids(user):
+    """
+    watched_ids() for async views, read with the async cache and ORM.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = watchlist_key(user)
+    ids = await cache.aget(key)
+    if ids is None:
+        ids = frozenset([pk async for pk in Watchlist.objects.filter(user_id=user.pk).values_list("listing_id", flat=True)])
+        await cache.aset(key, ids, WATCHLIST_TIMEOUT)
+    return ids
+
+
+def watch(user, listing_ids):
+    """
+    Adds listings to a user's watchlist.
+    Parameters:
+        user: the user whose watchlist changes
+        listing_ids: ids of the listings to watch; ids of listings that are
+                     already watched, or do not exist, are skipped
+    Returns:
+        The set of ids that were added
+    """
+    return _change(user, listing_ids, add=True)
+
+
+def unwatch(user, listing_ids):
+    """
+    Removes listings from a user's watchlist.
+    Returns the set of ids that were removed.
+    """
+    return _change(user, listing_ids, add=False)
+
+
+def _change(user, listing_ids, add):
+    if not user.is_authenticated:
+        return set()
+    ids = set(listing_ids)
+    with transaction.atomic():
+        # Serialize the changes of one user, so two requests cannot both
+        # find a listing unwatched and count it twice, and read the version
+        # the change raises; SQLite already takes the write lock when the
+        # transaction begins (commerce/database.py)
+        version = User.objects.select_for_update().filter(pk=user.pk).values_list("watchlist_version", flat=True).get()
+        if add:
+            # The listings that exist and are not watched yet, in one query
+            watched = Watchlist.objects.filter(user_id=user.pk, listing_id=OuterRef("pk"))
+            changed = set(Listing.objects.filter(pk__in=ids).exclude(Exists(watched)).values_list("pk", flat=True))
+            Watchlist.objects.bulk_create([Watchlist(user_id=user.pk, listing_id=pk) for pk in changed])
+        else:
+            changed = set(Watchlist.objects.filter(user_id=user.pk, listing_id__in=ids).values_list("listing_id", flat=True))
+            Watchlist.objects.filter(user_id=user.pk, listing_id__in=changed).delete()
+        if changed:
+            # The API serves the watcher count under the listing's version
+            Listing.objects.filter(pk__in=changed).update(
+                watcher_count=F("watcher_count") + (1 if add else -1), version=F("version") + 1
+            )
+            transaction.on_commit(lambda: watchers_changed.send(sender=Listing, listing_ids=changed))
+            invalidate(user.pk)
+            # Later lookups in this request use the new version too
+            user.watchlist_version = version + 1
+    return changed
+
+
+def recount():
+    """
+    Recounts the watchers of every listing, for watchlist rows inserted
+    without watch(), like bulk_create.
+    """
+    watchers = Watchlist.objects.filter(listing_id=OuterRef("pk")).order_by().values("listing_id")
+    Listing.objects.update(
+        watcher_count=Coalesce(Subquery(watchers.annotate(count=Count("pk")).values("count")), 0),
+        version=F("version") + 1,
+    )
+
+
+def invalidate(*user_ids):
+    """
+    Raises the watchlist version of the given users, so their cached sets
+    are no longer looked up once the transaction commits.
+    """
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(watchlist_version=F("watchlist_version") + 1)
+
+
+@receiver(m2m_changed, sender=Watchlist)
+def _count_watchers(sender, instance, action, reverse, pk_set, **kwargs):
+    # add() only reports the rows it inserted. remove() and clear() report
+    # what was asked for, so the rows are counted before they are deleted,
+    # in the same transaction
+    listingIds = ()
+    if action == "post_add" and pk_set:
+        if reverse:
+            listingIds = pk_set
+            Listing.objects.filter(pk__in=pk_set).update(watcher_count=F("watcher_count") + 1, version=F("version") + 1)
+        else:
+            listingIds = {instance.pk}
+            Listing.objects.filter(pk=instance.pk).update(watcher_count=F("watcher_count") + len(pk_set), version=F("version") + 1)
+    elif action in ("pre_remove", "pre_clear"):
+        if reverse:
+            rows = Watchlist.objects.filter(user_id=instance.pk)
+            if action == "pre_remove":
+                rows = rows.filter(listing_id__in=pk_set)
+            listingIds = set(rows.values_list("listing_id", flat=True))
+            Listing.objects.filter(pk__in=listingIds).update(watcher_count=F("watcher_count") - 1, version=F("version") + 1)
+        else:
+            rows = Watchlist.objects.filter(listing_id=instance.pk)
+            if action == "pre_remove":
+                rows = rows.filter(user_id__in=pk_set)
+            removed = rows.count()
+            if removed:
+                listingIds = {instance.pk}
+                Listing.objects.filter(pk=instance.pk).update(watcher_count=F("watcher_count") - removed, version=F("version") + 1)
+    if listingIds:
+        transaction.on_commit(lambda: watchers_changed.send(sender=Listing, listing_ids=set(listingIds)))
+
+
+@receiver(m2m_changed, sender=Watchlist)
+def _watchlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # listing.watchlist.add(user) passes user ids in pk_set, while
+    # user.listingWatchlist.add(listing) passes listing ids
+    if reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate(instance.pk)
+            instance.refresh_from_db(fields=["watchlist_version"])
+    elif action in ("post_add", "post_remove"):
+        invalidate(*pk_set)
+    elif action == "pre_clear":
+        invalidate(*Watchlist.objects.filter(listing_id=instance.pk).values_list("user_id", flat=True))